@@ -0,0 +1,60 @@
+"""
+Container sniffing for uploaded recordings.
+Looks at the first bytes of a file so the right decoder can be picked in one
+shot instead of trying webm -> ogg -> auto-detect with a new ffmpeg run each time.
+"""
+
+import struct
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def sniff_audio_format(path):
+    """Return "webm", "ogg", "wav", "flac", "mp4" or None if the container is not recognised"""
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if header.startswith(b"\x1a\x45\xdf\xa3"):  # EBML (WebM / Matroska)
+        return "webm"
+    if header.startswith(b"OggS"):
+        return "ogg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header.startswith(b"fLaC"):  # Stored clips (see transcoder.CLIP_CODECS)
+        return "flac"
+    if header[4:8] == b"ftyp":  # ISO BMFF (MP4 / M4A, e.g. Safari)
+        return "mp4"
+    return None
+
+
+def read_wav_format(path):
+    """Parse the fmt chunk of a RIFF/WAVE file.
+    Returns {"format", "channels", "sample_rate", "bits_per_sample"} or None if it is not a valid WAV."""
+    try:
+        with open(path, "rb") as f:
+            riff = f.read(12)
+            if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+                return None
+            while True:
+                chunk_header = f.read(8)
+                if len(chunk_header) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+                if chunk_id == b"fmt ":
+                    fmt = f.read(chunk_size)
+                    if len(fmt) < 16:
+                        return None
+                    audio_format, channels, sample_rate, _, _, bits_per_sample = struct.unpack("<HHIIHH", fmt[:16])
+                    if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        # Real format code is the first two bytes of the SubFormat GUID
+                        audio_format = struct.unpack("<H", fmt[24:26])[0]
+                    return {
+                        "format": audio_format,
+                        "channels": channels,
+                        "sample_rate": sample_rate,
+                        "bits_per_sample": bits_per_sample,
+                    }
+                # Chunks are word-aligned
+                f.seek(chunk_size + (chunk_size & 1), 1)
+    except OSError:
+        return None
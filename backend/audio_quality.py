@@ -0,0 +1,194 @@
+"""
+Ingest-time audio quality checks.
+
+The stored clip (16-bit PCM WAV) is decoded once into a NumPy array and all
+metrics are computed with vectorized operations over fixed-size frames:
+duration, RMS / peak level (dBFS), clipping ratio, leading / trailing
+silence, the noise floor (level of the quietest 10% of frames - the
+pauses before and after speech in a browser recording) and an SNR estimate:
+the level of the voiced frames (louder than QUALITY_SILENCE_DBFS) above that
+noise floor. Clips that fail
+the configured thresholds are rejected before anything is uploaded, so the
+speaker can re-record right away.
+
+Settings (environment variables, a threshold of 0 disables that check):
+- QUALITY_CHECKS: "false" to disable analysis (default: enabled if NumPy is installed)
+- QUALITY_SILENCE_DBFS: frames quieter than this count as silence (default: -45)
+- QUALITY_MIN_DURATION: shortest accepted clip in seconds (default: 0.5)
+- QUALITY_MIN_RMS_DBFS: quietest accepted overall level (default: -50)
+- QUALITY_MAX_CLIPPING: largest accepted fraction of clipped samples (default: 0.01)
+- QUALITY_MIN_SNR_DB: lowest accepted SNR estimate (default: 0, disabled)
+"""
+
+import importlib.util
+import os
+import wave
+
+from storage import QUALITY_FIELDS
+
+# Imported on first use (load_numpy), which keeps NumPy off the server's startup path
+np = None
+
+FRAME_SECONDS = 0.02
+# |sample| at or above this (on a -1..1 scale) counts as clipped
+CLIP_LEVEL = 32767 / 32768
+# dBFS used for digital silence instead of -inf
+FLOOR_DBFS = -120.0
+
+
+
+def numpy_available():
+    return importlib.util.find_spec("numpy") is not None
+
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+
+
+class PcmClip:
+    """A decoded 16-bit PCM WAV: interleaved int16 frames plus a mono float view for analysis"""
+
+    def __init__(self, frames, sample_rate):
+        self.frames = frames  # shape (frame count, channels)
+        self.sample_rate = sample_rate
+
+    @property
+    def mono(self):
+        """Mono float32 samples in -1..1"""
+        return self.frames.astype(np.float32).mean(axis=1) / 32768.0
+
+    @property
+    def duration(self):
+        return len(self.frames) / self.sample_rate
+
+    def slice(self, start, end):
+        return PcmClip(self.frames[start:end], self.sample_rate)
+
+    def write(self, path):
+        """Rewrite the WAV file (temp file + rename)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with wave.open(tmp_path, "wb") as w:
+            w.setnchannels(self.frames.shape[1])
+            w.setsampwidth(2)
+            w.setframerate(self.sample_rate)
+            w.writeframes(self.frames.astype("<i2").tobytes())
+        os.replace(tmp_path, path)
+
+
+def read_pcm(path):
+    """Decode a 16-bit PCM WAV into a PcmClip; None if it isn't one"""
+    load_numpy()
+    try:
+        with wave.open(path, "rb") as w:
+            if w.getsampwidth() != 2 or w.getcomptype() != "NONE":
+                return None
+            channels = w.getnchannels()
+            sample_rate = w.getframerate()
+            data = w.readframes(w.getnframes())
+    except (wave.Error, EOFError):
+        # Not a WAV file (e.g. saved as-is without ffmpeg)
+        return None
+    samples = np.frombuffer(data, dtype="<i2")
+    return PcmClip(samples[:len(samples) - len(samples) % channels].reshape(-1, channels), sample_rate)
+
+
+def to_dbfs(values):
+    return 20.0 * np.log10(np.maximum(values, 10 ** (FLOOR_DBFS / 20)))
+
+
+def frame_levels(samples, sample_rate, frame_seconds=FRAME_SECONDS):
+    """RMS level (dBFS) of consecutive frames; returns (levels, frame length in samples)"""
+    load_numpy()
+    frame_length = max(1, int(sample_rate * frame_seconds))
+    frame_count = len(samples) // frame_length
+    if frame_count == 0:
+        return np.full(1, to_dbfs(np.sqrt(np.mean(np.square(samples))) if len(samples) else 0.0)), len(samples) or 1
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    return to_dbfs(np.sqrt(np.mean(np.square(frames), axis=1))), frame_length
+
+
+def voiced_span(levels, silence_dbfs):
+    """(first, last + 1) indices of frames louder than silence_dbfs; (0, 0) if all silent"""
+    voiced = np.flatnonzero(levels > silence_dbfs)
+    if len(voiced) == 0:
+        return 0, 0
+    return int(voiced[0]), int(voiced[-1]) + 1
+
+
+def analyze(samples, sample_rate, silence_dbfs=-45.0):
+    """Quality metrics for mono float samples"""
+    load_numpy()
+    duration = len(samples) / sample_rate
+    if len(samples) == 0:
+        return dict.fromkeys(QUALITY_FIELDS, 0.0) | {"rms_dbfs": FLOOR_DBFS, "peak_dbfs": FLOOR_DBFS}
+
+    magnitudes = np.abs(samples)
+    levels, frame_length = frame_levels(samples, sample_rate)
+    first, last = voiced_span(levels, silence_dbfs)
+    frame_seconds = frame_length / sample_rate
+    if last == 0:
+        leading = trailing = duration
+    else:
+        leading = first * frame_seconds
+        trailing = max(0.0, duration - last * frame_seconds)
+
+    # Background level in the pauses, and the voiced frames' mean power above it. An estimate:
+    # a clip without pauses has no frames of noise alone, so it scores close to 0 dB
+    noise_floor = np.percentile(levels, 10)
+    voiced = levels[levels > silence_dbfs]
+    snr = float(to_dbfs(np.sqrt(np.mean(10 ** (voiced / 10)))) - noise_floor) if len(voiced) else 0.0
+
+    return {
+        "duration": round(duration, 3),
+        "rms_dbfs": round(float(to_dbfs(np.sqrt(np.mean(np.square(samples))))), 2),
+        "peak_dbfs": round(float(to_dbfs(magnitudes.max())), 2),
+        "clipping_ratio": round(float(np.count_nonzero(magnitudes >= CLIP_LEVEL)) / len(samples), 5),
+        "leading_silence": round(leading, 3),
+        "trailing_silence": round(trailing, 3),
+        "noise_floor_dbfs": round(float(noise_floor), 2),
+        "snr_db": round(max(0.0, snr), 2),
+    }
+
+
+class QualityChecker:
+    def __init__(self, silence_dbfs=-45.0, min_duration=0.5, min_rms_dbfs=-50.0, max_clipping=0.01, min_snr_db=0.0):
+        self.silence_dbfs = silence_dbfs
+        self.min_duration = min_duration
+        self.min_rms_dbfs = min_rms_dbfs
+        self.max_clipping = max_clipping
+        self.min_snr_db = min_snr_db
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            silence_dbfs=float(os.getenv('QUALITY_SILENCE_DBFS', '-45')),
+            min_duration=float(os.getenv('QUALITY_MIN_DURATION', '0.5')),
+            min_rms_dbfs=float(os.getenv('QUALITY_MIN_RMS_DBFS', '-50')),
+            max_clipping=float(os.getenv('QUALITY_MAX_CLIPPING', '0.01')),
+            min_snr_db=float(os.getenv('QUALITY_MIN_SNR_DB', '0')),
+        )
+
+    @staticmethod
+    def enabled():
+        return numpy_available() and os.getenv('QUALITY_CHECKS', 'true').lower() not in ('0', 'false', 'no')
+
+    def analyze_clip(self, clip):
+        return analyze(clip.mono, clip.sample_rate, silence_dbfs=self.silence_dbfs)
+
+    def problems(self, metrics):
+        """(reason, message) pairs explaining why the clip should be rejected (empty if it passes)"""
+        problems = []
+        if self.min_duration and metrics["duration"] < self.min_duration:
+            problems.append(("too_short", f"recording is too short ({metrics['duration']:.1f}s)"))
+        if metrics["leading_silence"] >= metrics["duration"]:
+            problems.append(("silent", "no speech detected"))
+        elif self.min_rms_dbfs and metrics["rms_dbfs"] < self.min_rms_dbfs:
+            problems.append(("too_quiet", "recording is too quiet"))
+        if self.max_clipping and metrics["clipping_ratio"] > self.max_clipping:
+            problems.append(("clipping", "recording is distorted (too loud)"))
+        if self.min_snr_db and metrics["leading_silence"] < metrics["duration"] and metrics["snr_db"] < self.min_snr_db:
+            problems.append(("noisy", "too much background noise"))
+        return problems
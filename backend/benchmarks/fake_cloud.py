@@ -0,0 +1,70 @@
+"""
+main.app with Dropbox / Google Drive replaced by an in-process fake, for
+benchmarks and load tests (no cloud credentials needed):
+
+    uvicorn benchmarks.fake_cloud:app --app-dir backend
+
+Settings (environment variables):
+- FAKE_CLOUD_LATENCY: seconds each fake upload takes (default: 0.05)
+"""
+
+import os
+import time
+
+import main
+
+
+class FakeDropbox:
+    """Stands in for DropboxUploader: accepts every upload after a fixed delay"""
+
+    dbx = True
+    folder_path = "/fake"
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.uploads = 0
+        self.files = set()
+
+    def upload_file(self, local_path, dropbox_path=None):
+        time.sleep(self.latency)
+        self.uploads += 1
+        self.files.add(os.path.basename(local_path))
+        return True
+
+    def upload_files_batch(self, local_paths):
+        time.sleep(self.latency)
+        self.uploads += len(local_paths)
+        return True
+
+    def file_exists(self, filename):
+        return False
+
+    def get_file_metadata(self, filename):
+        return False
+
+    def download_file(self, dropbox_filename, local_path, remote_hash=None):
+        return False
+
+    def open_file(self, dropbox_filename):
+        return None
+
+    def list_audio_files(self):
+        return sorted(self.files), "fake-cursor"
+
+    def list_changes(self, cursor):
+        return set(), cursor
+
+    def wait_for_changes(self, cursor, timeout=30):
+        return None
+
+
+def connect_fake_cloud():
+    """Replaces main.connect_integrations, which the warm-up calls before restoring state"""
+    main.dropbox_uploader = FakeDropbox(float(os.getenv('FAKE_CLOUD_LATENCY', '0.05')))
+    main.DROPBOX_ENABLED = True
+    main.upload_handlers.update(dropbox=main.upload_to_dropbox, dropbox_snapshot=main.upload_state_snapshot)
+
+
+main.connect_integrations = connect_fake_cloud
+
+app = main.app
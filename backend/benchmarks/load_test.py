@@ -0,0 +1,246 @@
+"""
+Load test for the recording API, run in-process against main.app.
+
+Virtual speakers loop over /next_sentence + /submit_recording with synthetic
+WebM/Ogg/WAV clips, and every few rounds also hit /stats and /all_speakers.
+Dropbox is replaced by the latency-injecting fake from fake_cloud.py, so no
+credentials are needed. The report (JSON) has throughput, p50/p95/p99
+latency and error counts per endpoint, plus the RSS of the server process
+and its transcoding workers - commit it next to a change to track
+regressions.
+
+    python benchmarks/load_test.py --concurrency 16 --duration 30 --output report.json
+
+WebM/Ogg clips are encoded with ffmpeg; without it only WAV is used.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Encoders close to what browsers' MediaRecorder produces
+FFMPEG_ENCODERS = {
+    "webm": ["-c:a", "libopus", "-b:a", "48k", "-f", "webm"],
+    "ogg": ["-c:a", "libopus", "-b:a", "48k", "-f", "ogg"],
+}
+
+
+def make_wav(seconds, sample_rate=48000, channels=1, frequency=440.0):
+    frames = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * frequency * i / sample_rate))) * channels
+        for i in range(int(seconds * sample_rate))
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(frames)
+    return buffer.getvalue()
+
+
+def make_clips(formats, seconds, variants=4):
+    """Synthetic clips per format (a few pitches each so uploads aren't byte-identical)"""
+    ffmpeg = shutil.which(os.getenv('FFMPEG_BINARY', 'ffmpeg'))
+    clips = {}
+    for fmt in formats:
+        if fmt == "wav":
+            clips[fmt] = [make_wav(seconds, frequency=220.0 * (i + 1)) for i in range(variants)]
+        elif fmt in FFMPEG_ENCODERS and ffmpeg:
+            clips[fmt] = [
+                subprocess.run(
+                    [ffmpeg, "-v", "error", "-f", "lavfi", "-i", f"sine=frequency={220 * (i + 1)}:duration={seconds}",
+                     "-ac", "1", "-ar", "48000", *FFMPEG_ENCODERS[fmt], "pipe:1"],
+                    check=True, capture_output=True,
+                ).stdout
+                for i in range(variants)
+            ]
+        else:
+            print(f"⚠️ Skipping {fmt} clips (ffmpeg not available)", file=sys.stderr)
+    return clips
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies, statuses, elapsed):
+    ok = [latency for latency, status in zip(latencies, statuses) if status < 400]
+    summary = {
+        "requests": len(latencies),
+        "errors": dict(Counter(str(status) for status in statuses if status >= 400)),
+        "throughput_per_s": round(len(ok) / elapsed, 2),
+    }
+    if ok:
+        summary.update(
+            mean_ms=round(statistics.fmean(ok) * 1000, 2),
+            p50_ms=round(percentile(ok, 50) * 1000, 2),
+            p95_ms=round(percentile(ok, 95) * 1000, 2),
+            p99_ms=round(percentile(ok, 99) * 1000, 2),
+        )
+    return summary
+
+
+def rss_mb(pid="self"):
+    """Current resident set size from /proc (Linux), or None"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+class LoadTest:
+    def __init__(self, client, clips, args):
+        self.client = client
+        self.clips = clips
+        self.args = args
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(list)
+
+    async def request(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        self.statuses[endpoint].append(response.status_code)
+        return response
+
+    async def speaker(self, index, deadline):
+        speaker = f"loadtest{index}"
+        rounds = 0
+        while time.monotonic() < deadline:
+            response = await self.request("/next_sentence", "GET", "/next_sentence", params={"speaker": speaker})
+            sentence = response.json() if response.status_code == 200 else {}
+            if sentence.get("sentence"):
+                fmt = random.choice(list(self.clips))
+                await self.request(
+                    "/submit_recording", "POST", "/submit_recording",
+                    files={"audio": (f"recording.{fmt}", random.choice(self.clips[fmt]), f"audio/{fmt}")},
+                    data={"sentence": sentence["sentence"], "sentence_id": str(sentence["sentence_id"]),
+                          "speaker": speaker},
+                )
+            elif sentence.get("completed"):
+                return
+            rounds += 1
+            if rounds % self.args.stats_every == 0:
+                await self.request("/stats", "GET", "/stats")
+                await self.request("/all_speakers", "GET", "/all_speakers")
+
+    async def run(self):
+        deadline = time.monotonic() + self.args.duration
+        started = time.perf_counter()
+        await asyncio.gather(*(self.speaker(i, deadline) for i in range(self.args.concurrency)))
+        return time.perf_counter() - started
+
+
+async def run(args, clips):
+    import httpx
+    import benchmarks.fake_cloud as fake_cloud
+
+    app = fake_cloud.app
+    await app.router.startup()
+    # Startup restores state in the background; measure the warmed-up server
+    await fake_cloud.main.readiness.wait()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            test = LoadTest(client, clips, args)
+            elapsed = await test.run()
+            rss = {
+                "server_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "server_current_mb": rss_mb(),
+                "transcode_workers_mb": [rss_mb(child.pid) for child in multiprocessing.active_children()],
+            }
+            outbox = fake_cloud.main.outbox.status()
+            transcode_workers = fake_cloud.main.transcoder.workers if fake_cloud.main.AUDIO_CONVERSION_ENABLED else 0
+    finally:
+        await app.router.shutdown()
+
+    endpoints = {
+        endpoint: summarize(test.latencies[endpoint], test.statuses[endpoint], elapsed)
+        for endpoint in sorted(test.latencies)
+    }
+    all_latencies = [latency for values in test.latencies.values() for latency in values]
+    all_statuses = [status for values in test.statuses.values() for status in values]
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "clip_seconds": args.clip_seconds,
+            "formats": sorted(clips),
+            "dropbox_latency_s": args.dropbox_latency,
+            "sentences": args.sentences,
+            "transcode_workers": transcode_workers,
+        },
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+        "elapsed_s": round(elapsed, 2),
+        "overall": summarize(all_latencies, all_statuses, elapsed),
+        "endpoints": endpoints,
+        "rss": rss,
+        "upload_queue_at_end": outbox,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual speakers")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--clip-seconds", type=float, default=4.0, help="length of the synthetic clips")
+    parser.add_argument("--formats", default="webm,ogg,wav", help="comma-separated clip formats")
+    parser.add_argument("--dropbox-latency", type=float, default=0.2, help="seconds per fake Dropbox upload")
+    parser.add_argument("--sentences", type=int, default=50000, help="size of the generated sentences.txt")
+    parser.add_argument("--stats-every", type=int, default=5, help="rounds between /stats + /all_speakers calls")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    clips = make_clips(args.formats.split(","), args.clip_seconds)
+    if not clips:
+        parser.error("no clip formats available")
+
+    output = os.path.abspath(args.output) if args.output else None
+    work_dir = tempfile.mkdtemp(prefix="loadtest-")
+    try:
+        # main.py works relative to the current directory
+        os.chdir(work_dir)
+        with open("sentences.txt", "w", encoding="utf-8") as f:
+            f.writelines(f"ሰላም ዓለም {i}\n" for i in range(args.sentences))
+        os.environ["FAKE_CLOUD_LATENCY"] = str(args.dropbox_latency)
+        sys.path.insert(0, BACKEND_DIR)
+        # The server's progress prints go to stderr so stdout stays valid JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run(args, clips))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Report written to {output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
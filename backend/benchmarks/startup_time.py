@@ -0,0 +1,161 @@
+"""
+Cold-start benchmark: how long a fresh server process takes to import, to
+answer its first request and to finish the warm-up.
+
+Each run starts `uvicorn main:app` in an empty working directory (with a
+generated sentences.txt) and measures, from the moment the process is
+spawned:
+
+- import_s: `import main` alone, in a separate interpreter
+- first_response_s: until GET / answers (the server is listening)
+- ready_s: until /health stops reporting "warming"
+- first_request_ms: latency of the first /next_sentence after that
+
+Cloud credentials are taken from the environment, so running it with the
+production .env settings includes the real Dropbox connection; without
+them the Dropbox/Google Drive helpers are still imported and tried. With
+--app benchmarks.fake_cloud:app the cloud is faked entirely.
+
+    python benchmarks/startup_time.py --runs 5 --imports 15
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_sentences(work_dir, count):
+    with open(os.path.join(work_dir, "sentences.txt"), "w", encoding="utf-8") as f:
+        f.writelines(f"ሰላም ዓለም {i}\n" for i in range(count))
+
+
+def measure_import(work_dir, env):
+    """Seconds to import main in a fresh interpreter, plus the -X importtime report"""
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); started = time.perf_counter(); "
+        "import main; print(time.perf_counter() - started)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, BACKEND_DIR],
+        cwd=work_dir, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_log, count):
+    """Top-level imports and the modules they import directly, by cumulative time"""
+    entries = []
+    for line in importtime_log.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match and len(match.group(3)) <= 3:
+            entries.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(entries, reverse=True)[:count]
+
+
+def wait_for(url, deadline, accept=lambda response: response.ok):
+    while time.perf_counter() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if accept(response):
+                return time.perf_counter()
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+
+def measure_server(app, work_dir, env, timeout):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--app-dir", BACKEND_DIR, "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + timeout
+        first_response = wait_for(f"{base_url}/", deadline)
+        ready = wait_for(
+            f"{base_url}/health", deadline,
+            lambda response: response.ok and response.json().get("status") != "warming",
+        )
+        request_started = time.perf_counter()
+        requests.get(f"{base_url}/next_sentence", params={"speaker": "startup"}, timeout=30)
+        first_request = time.perf_counter() - request_started
+        status = requests.get(f"{base_url}/health", timeout=5).json().get("status")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        "first_response_s": round(first_response - started, 3),
+        "ready_s": round(ready - started, 3),
+        "first_request_ms": round(first_request * 1000, 1),
+        "health": status,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main:app", help="ASGI app to start")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--sentences", type=int, default=10000, help="size of the generated sentences.txt")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for a server to get ready")
+    parser.add_argument("--imports", type=int, default=10, help="list the N slowest imports of main")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    runs, importtime_log = [], ""
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_sentences(work_dir, args.sentences)
+            import_seconds, importtime_log = measure_import(work_dir, env)
+        with tempfile.TemporaryDirectory() as work_dir:
+            write_sentences(work_dir, args.sentences)
+            run = {"import_s": round(import_seconds, 3)}
+            run.update(measure_server(args.app, work_dir, env, args.timeout))
+            runs.append(run)
+
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ("import_s", "first_response_s", "ready_s", "first_request_ms")
+    }
+    print(f"| {args.app} ({args.runs} runs, median) | seconds |")
+    print("|---|---|")
+    print(f"| import main | {summary['import_s']} |")
+    print(f"| spawn -> first response | {summary['first_response_s']} |")
+    print(f"| spawn -> ready | {summary['ready_s']} |")
+    print(f"| first /next_sentence | {summary['first_request_ms'] / 1000:.3f} |")
+    print(f"\nHealth after warm-up: {runs[-1]['health']}")
+    if args.imports:
+        print("\nSlowest imports (cumulative ms):")
+        for ms, module in slowest_imports(importtime_log, args.imports):
+            print(f"  {ms:8.1f}  {module}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"app": args.app, "median": summary, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
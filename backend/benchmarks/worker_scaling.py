@@ -0,0 +1,187 @@
+"""
+Submit-throughput benchmark for multi-worker mode (SHARED_STATE=true).
+
+For each worker count it starts `uvicorn --workers N` on a fresh SQLite
+database with fake cloud uploads (benchmarks/fake_cloud.py), drives
+/next_sentence + /submit_recording from concurrent clients and reports
+throughput and latency. It also checks that the shared state stayed
+consistent: one metadata row per accepted clip, no reused clip number and
+no sentence handed to two speakers.
+
+Throughput can only grow with the worker count up to the number of CPU cores
+the server may use, which is printed with the results.
+
+    python benchmarks/worker_scaling.py --workers 1,2,4 --requests 400
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import socket
+import sqlite3
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_wav(seconds, sample_rate=16000, channels=1):
+    frames = b"".join(
+        struct.pack("<h", int(8000 * math.sin(i / 20))) * channels
+        for i in range(int(seconds * sample_rate))
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(frames)
+    return buffer.getvalue()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_count():
+    """CPU cores this process (and the server it starts) may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS / Windows
+        return os.cpu_count()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def start_server(workers, work_dir, port, latency):
+    env = dict(
+        os.environ,
+        STORAGE_BACKEND="sqlite",
+        SHARED_STATE="true",
+        FAKE_CLOUD_LATENCY=str(latency),
+        SNAPSHOT_INTERVAL="5",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.fake_cloud:app", "--app-dir", BACKEND_DIR,
+         "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            health = requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            if health.ok and health.json().get("status") != "warming":
+                return process
+            time.sleep(0.2)
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not start")
+
+
+def run_client(base_url, audio, speaker, count):
+    latencies, errors = [], Counter()
+    session = requests.Session()
+    for _ in range(count):
+        start = time.perf_counter()
+        sentence = session.get(f"{base_url}/next_sentence", params={"speaker": speaker}).json()
+        if not sentence.get("sentence"):
+            errors["no sentence"] += 1
+            continue
+        response = session.post(
+            f"{base_url}/submit_recording",
+            files={"audio": ("recording.wav", audio, "audio/wav")},
+            data={"sentence": sentence["sentence"], "sentence_id": sentence["sentence_id"], "speaker": speaker},
+        )
+        if response.ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors[str(response.status_code)] += 1
+    return latencies, errors
+
+
+def bench(workers, args, audio):
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, "sentences.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"ሰላም ዓለም {i}\n" for i in range(args.sentences))
+        port = free_port()
+        process = start_server(workers, work_dir, port, args.latency)
+        try:
+            per_client = args.requests // args.concurrency
+            started = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                results = list(pool.map(
+                    lambda i: run_client(f"http://127.0.0.1:{port}", audio, f"speaker{i}", per_client),
+                    range(args.concurrency),
+                ))
+            elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+        latencies = [latency for client, _ in results for latency in client]
+        conn = sqlite3.connect(os.path.join(work_dir, "recordings.db"))
+        rows = conn.execute("SELECT filename, sentence FROM recordings").fetchall()
+        conn.close()
+        filenames = [name for name, _ in rows]
+        sentences = [sentence for _, sentence in rows]
+        clip_numbers = [name.split("_")[-3] for name in filenames]
+        return {
+            "workers": workers,
+            "submits": len(latencies),
+            "errors": dict(sum((errors for _, errors in results), Counter())),
+            "throughput_per_s": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+            "metadata_rows": len(filenames),
+            "duplicate_clip_numbers": len(clip_numbers) - len(set(clip_numbers)),
+            "duplicate_sentences": len(sentences) - len(set(sentences)),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--requests", type=int, default=400, help="submissions per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--sentences", type=int, default=10000, help="size of the generated sentences.txt")
+    parser.add_argument("--seconds", type=float, default=3.0, help="clip length")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake upload latency (seconds)")
+    parser.add_argument("--transcode", action="store_true",
+                        help="send 44.1kHz stereo clips so every submission goes through ffmpeg")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    audio = make_wav(args.seconds, 44100, 2) if args.transcode else make_wav(args.seconds)
+    results = [bench(int(workers), args, audio) for workers in args.workers.split(",")]
+
+    print(f"{cpu_count()} CPU cores, {args.concurrency} clients, {args.seconds:g} s clips"
+          f"{' (transcoded)' if args.transcode else ''}, {args.latency * 1000:g} ms fake upload latency\n")
+    print("| workers | submits/s | p50 ms | p95 ms | errors by status | rows | duplicate numbers | duplicate sentences |")
+    print("|---|---|---|---|---|---|---|---|")
+    for r in results:
+        print(f"| {r['workers']} | {r['throughput_per_s']} | {r['p50_ms']} | {r['p95_ms']} | "
+              f"{r['errors'] or '-'} | {r['metadata_rows']} | {r['duplicate_clip_numbers']} | {r['duplicate_sentences']} |")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpu_cores": cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Streaming dataset export (tar / WebDataset shards).
+
+The archive is generated member by member while it is being sent: each tar
+header is built from the clip's size, then the clip bytes are copied through
+in fixed-size chunks from the local file or straight from Dropbox. Nothing
+is staged on disk or buffered beyond one chunk, so exporting the whole
+dataset costs the same memory as exporting one clip.
+
+Every clip is written WebDataset-style as <key>.<ext> + <key>.json (sentence,
+speaker, recording time, codec and quality metrics), where the key is the
+clip filename without extension. A single archive ends with a metadata.csv
+of the clips it contains. Rows are exported in metadata order. Shards are
+cut by clip number: shard N of shard_size S holds the clips numbered
+N*S+1 .. (N+1)*S. Clip numbers never change, so new recordings and clips
+deleted from Dropbox don't move any other shard's boundaries, and an
+interrupted download can resume at the shard it stopped at.
+
+Settings (environment variables):
+- EXPORT_TOKEN: bearer token required by /export (the endpoint is disabled without one)
+"""
+
+import hmac
+import io
+import json
+import os
+import tarfile
+import time
+from datetime import datetime, timezone
+
+from metadata_index import clip_number, parse_speaker
+
+CHUNK_SIZE = 64 * 1024
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def export_token():
+    return os.getenv('EXPORT_TOKEN', '')
+
+
+def authorized(authorization):
+    """True if the Authorization header carries the configured bearer token"""
+    token = export_token()
+    if not token or not authorization:
+        return False
+    scheme, _, value = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(value.strip().encode(), token.encode())
+
+
+def parse_time(value):
+    """Unix seconds or an ISO 8601 date/datetime (UTC unless it has an offset); None if empty"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def clip_timestamp(filename):
+    """Recording time from a clip filename (speaker_num_timestamp_id.ext), or None"""
+    parts = os.path.splitext(os.path.basename(filename))[0].split('_')
+    if len(parts) < 3:
+        return None
+    try:
+        return int(parts[-2])
+    except ValueError:
+        return None
+
+
+class ExportFilter:
+    """Selects recordings by speaker, recording time (since <= t < until) and sentence"""
+
+    def __init__(self, speakers=None, since=None, until=None, sentences=None):
+        self.speakers = set(speakers) if speakers else None
+        self.since = since
+        self.until = until
+        self.sentences = set(sentences) if sentences is not None else None
+
+    def matches(self, filepath, sentence):
+        if self.sentences is not None and sentence not in self.sentences:
+            return False
+        filename = os.path.basename(filepath)
+        if self.speakers is not None and parse_speaker(filename) not in self.speakers:
+            return False
+        if self.since is not None or self.until is not None:
+            recorded_at = clip_timestamp(filename)
+            if recorded_at is None:
+                return False
+            if self.since is not None and recorded_at < self.since:
+                return False
+            if self.until is not None and recorded_at >= self.until:
+                return False
+        return True
+
+    def select(self, rows):
+        return [(filepath, sentence) for filepath, sentence in rows if self.matches(filepath, sentence)]
+
+
+def shard_index(filepath, shard_size):
+    """Shard of a clip: numbers 1..shard_size are shard 0, and so on (unnumbered clips go to shard 0)"""
+    number = clip_number(filepath)
+    return (number - 1) // shard_size if number else 0
+
+
+def split_shards(rows, shard_size):
+    """{shard index: rows} of the shards that have clips (one shard 0 with all rows when shard_size is 0)"""
+    if not shard_size:
+        return {0: rows}
+    shards = {}
+    for row in rows:
+        shards.setdefault(shard_index(row[0], shard_size), []).append(row)
+    return dict(sorted(shards.items()))
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+    """Yield a file's contents in chunks, closing it at the end"""
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def open_local(filepath):
+    """(size, chunks) for a local file, or None if it doesn't exist.
+    The file is opened before its size is taken, so it stays readable even if an upload
+    worker deletes it meanwhile."""
+    try:
+        f = open(filepath, "rb")
+    except FileNotFoundError:
+        return None
+    return os.fstat(f.fileno()).st_size, read_chunks(f)
+
+
+def tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    # PAX headers keep long / non-ASCII names intact
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+
+def tar_member(name, size, chunks, mtime):
+    """Header, data and padding of one tar member"""
+    yield tar_header(name, size, mtime)
+    written = 0
+    for chunk in chunks:
+        written += len(chunk)
+        yield chunk
+    if written != size:
+        # The header already promised `size` bytes - a short read would corrupt the archive
+        raise IOError(f"{name}: expected {size} bytes, got {written}")
+    if size % BLOCK_SIZE:
+        yield b"\0" * (BLOCK_SIZE - size % BLOCK_SIZE)
+
+
+def bytes_member(name, data, mtime):
+    return tar_member(name, len(data), [data], mtime)
+
+
+def clip_record(filepath, sentence, info):
+    filename = os.path.basename(filepath)
+    recorded_at = clip_timestamp(filename)
+    record = {
+        "filename": filename,
+        "sentence": sentence,
+        "speaker": parse_speaker(filename),
+        "recorded_at": datetime.fromtimestamp(recorded_at, timezone.utc).isoformat() if recorded_at else None,
+    }
+    record.update(info or {})
+    # Client-generated and only meaningful for retries; the content hash stays as a checksum
+    record.pop("idempotency_key", None)
+    return record
+
+
+def stream_archive(rows, open_clip, clip_info=None, include_csv=True):
+    """Generate a tar of the given (filepath, sentence) rows.
+    open_clip(filepath) returns (size, chunks) or None if the clip is unavailable (it is skipped).
+    clip_info maps filenames to extra JSON fields (codec, quality metrics)."""
+    clip_info = clip_info or {}
+    exported = []
+    for filepath, sentence in rows:
+        filename = os.path.basename(filepath)
+        clip = open_clip(filepath)
+        if clip is None:
+            print(f"⚠️ Export: {filename} not available locally or in Dropbox - skipped")
+            continue
+        size, chunks = clip
+        key, extension = os.path.splitext(filename)
+        mtime = clip_timestamp(filename) or time.time()
+        yield from tar_member(filename, size, chunks, mtime)
+        record = clip_record(filepath, sentence, clip_info.get(filename))
+        yield from bytes_member(f"{key}.json", json.dumps(record, ensure_ascii=False).encode("utf-8"), mtime)
+        exported.append((filename, sentence))
+
+    if include_csv:
+        csv = io.StringIO()
+        csv.write("filename|sentence\n")
+        csv.writelines(f"{filename}|{sentence}\n" for filename, sentence in exported)
+        yield from bytes_member("metadata.csv", csv.getvalue().encode("utf-8"), time.time())
+
+    # End-of-archive marker: two zero blocks
+    yield b"\0" * (2 * BLOCK_SIZE)
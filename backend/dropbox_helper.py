@@ -5,14 +5,48 @@ Supports both long-lived tokens and OAuth refresh tokens.
 """
 
 import dropbox
-from dropbox.exceptions import ApiError, AuthError
+from dropbox.exceptions import ApiError, AuthError, InternalServerError, RateLimitError
+from dropbox.files import CommitInfo, DeletedMetadata, FileMetadata, UploadSessionCursor, UploadSessionFinishArg, WriteMode
+import hashlib
 import os
+import requests
 from dotenv import load_dotenv
 import time
 
 # Load environment variables
 load_dotenv()
 
+# Files larger than this are streamed through an upload session instead of a single
+# files_upload call (which is capped at 150 MB and needs the whole file in memory)
+UPLOAD_SESSION_THRESHOLD = int(os.getenv('DROPBOX_UPLOAD_SESSION_THRESHOLD', str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv('DROPBOX_UPLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+UPLOAD_RETRIES = 5
+# Streamed downloads (e.g. /export) are read in pieces of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Errors worth retrying with backoff (network drops, 5xx, rate limiting)
+TRANSIENT_ERRORS = (InternalServerError, RateLimitError, requests.exceptions.RequestException)
+
+# Clip extensions for every storage codec (see transcoder.CLIP_CODECS)
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.opus')
+
+# Dropbox content_hash: SHA-256 of the concatenated SHA-256 digests of each 4 MB block
+CONTENT_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def content_hash(local_file_path):
+    """Dropbox content_hash of a local file, or None if it doesn't exist"""
+    try:
+        with open(local_file_path, 'rb') as f:
+            digests = b''.join(
+                hashlib.sha256(block).digest()
+                for block in iter(lambda: f.read(CONTENT_HASH_BLOCK_SIZE), b'')
+            )
+    except FileNotFoundError:
+        return None
+    return hashlib.sha256(digests).hexdigest()
+
+
 class DropboxUploader:
     def __init__(self):
         """Initialize Dropbox connection"""
@@ -73,23 +107,80 @@ class DropboxUploader:
                 return func(*args, **kwargs)
             raise
     
+    def _retry_transient(self, func, *args, **kwargs):
+        """Retry an API call with exponential backoff on transient errors"""
+        for attempt in range(UPLOAD_RETRIES + 1):
+            try:
+                return self._retry_on_auth_error(func, *args, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if attempt == UPLOAD_RETRIES:
+                    raise
+                delay = getattr(e, 'backoff', None) or min(2 ** attempt, 30)
+                print(f"⚠️ Dropbox request failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _upload_chunks(self, f, file_size, close=False):
+        """Stream an open file through an upload session in UPLOAD_CHUNK_SIZE pieces.
+        A retried chunk resumes from the last offset Dropbox acknowledged.
+        Returns the session cursor positioned at the end of the file."""
+        session_id = None
+        offset = 0
+        while True:
+            f.seek(offset)
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            is_last = offset + len(chunk) >= file_size
+            try:
+                if session_id is None:
+                    result = self._retry_transient(
+                        self.dbx.files_upload_session_start, chunk, close=close and is_last
+                    )
+                    session_id = result.session_id
+                else:
+                    self._retry_transient(
+                        self.dbx.files_upload_session_append_v2,
+                        chunk,
+                        UploadSessionCursor(session_id=session_id, offset=offset),
+                        close=close and is_last
+                    )
+            except ApiError as e:
+                lookup_error = e.error
+                if session_id and lookup_error.is_incorrect_offset():
+                    # Part of the data already arrived (e.g. a retried request) - resume where Dropbox is
+                    offset = lookup_error.get_incorrect_offset().correct_offset
+                    print(f"🔁 Resuming upload session at offset {offset}")
+                    continue
+                raise
+            offset += len(chunk)
+            if is_last:
+                return UploadSessionCursor(session_id=session_id, offset=offset)
+
     def upload_file(self, local_file_path):
-        """Upload a file to Dropbox"""
+        """Upload a file to Dropbox (large files are sent in chunks through an upload session)"""
         if not self.dbx:
             return False
         
         try:
             file_name = os.path.basename(local_file_path)
             dropbox_path = f"{self.folder_path}/{file_name}"
+            file_size = os.path.getsize(local_file_path)
             
             with open(local_file_path, 'rb') as f:
-                # Upload file with retry on auth error
-                self._retry_on_auth_error(
-                    self.dbx.files_upload,
-                    f.read(),
-                    dropbox_path,
-                    mode=dropbox.files.WriteMode.overwrite
-                )
+                if file_size <= UPLOAD_SESSION_THRESHOLD:
+                    # Upload file with retry on auth error
+                    self._retry_transient(
+                        self.dbx.files_upload,
+                        f.read(),
+                        dropbox_path,
+                        mode=WriteMode.overwrite
+                    )
+                else:
+                    cursor = self._upload_chunks(f, file_size)
+                    self._retry_transient(
+                        self.dbx.files_upload_session_finish,
+                        b"",
+                        cursor,
+                        CommitInfo(path=dropbox_path, mode=WriteMode.overwrite)
+                    )
             
             print(f"✅ Uploaded to Dropbox: {file_name}")
             return True
@@ -101,11 +192,50 @@ class DropboxUploader:
             print(f"❌ Error uploading {local_file_path}: {e}")
             return False
     
-    def download_file(self, dropbox_filename, local_file_path):
-        """Download a file from Dropbox. Returns True if downloaded, False if file doesn't exist or error."""
+    def upload_files_batch(self, local_file_paths):
+        """Upload several files and commit them together with files_upload_session_finish_batch.
+        Returns True only if every file was committed."""
+        if not self.dbx:
+            return False
+        
+        try:
+            entries = []
+            for local_file_path in local_file_paths:
+                dropbox_path = f"{self.folder_path}/{os.path.basename(local_file_path)}"
+                with open(local_file_path, 'rb') as f:
+                    # Batch commits need closed sessions
+                    cursor = self._upload_chunks(f, os.path.getsize(local_file_path), close=True)
+                entries.append(UploadSessionFinishArg(
+                    cursor=cursor,
+                    commit=CommitInfo(path=dropbox_path, mode=WriteMode.overwrite)
+                ))
+            
+            result = self._retry_transient(self.dbx.files_upload_session_finish_batch_v2, entries)
+            
+            all_committed = True
+            for local_file_path, entry in zip(local_file_paths, result.entries):
+                file_name = os.path.basename(local_file_path)
+                if entry.is_success():
+                    print(f"✅ Uploaded to Dropbox: {file_name}")
+                else:
+                    all_committed = False
+                    print(f"❌ Dropbox batch commit failed for {file_name}: {entry.get_failure()}")
+            return all_committed
+            
+        except Exception as e:
+            print(f"❌ Error uploading batch {[os.path.basename(p) for p in local_file_paths]}: {e}")
+            return False
+    
+    def download_file(self, dropbox_filename, local_file_path, remote_hash=None):
+        """Download a file from Dropbox. Returns True if downloaded, False if file doesn't exist or error.
+        If remote_hash (the file's content_hash) matches the local copy, nothing is downloaded."""
         if not self.dbx:
             return None  # Dropbox not configured
         
+        if remote_hash and content_hash(local_file_path) == remote_hash:
+            print(f"✅ {dropbox_filename} is up to date - download skipped")
+            return True
+        
         try:
             dropbox_path = f"{self.folder_path}/{dropbox_filename}"
             
@@ -115,9 +245,11 @@ class DropboxUploader:
                 dropbox_path
             )
             
-            # Save to local file
-            with open(local_file_path, 'wb') as f:
+            # Save to local file (temp file + rename, so an interrupted download never leaves a partial copy)
+            tmp_path = f"{local_file_path}.{os.getpid()}.download"
+            with open(tmp_path, 'wb') as f:
                 f.write(res.content)
+            os.replace(tmp_path, local_file_path)
             
             print(f"✅ Downloaded from Dropbox: {dropbox_filename}")
             return True
@@ -133,6 +265,54 @@ class DropboxUploader:
             print(f"❌ Error downloading {dropbox_filename}: {e}")
             return None  # Error occurred
     
+    def open_file(self, dropbox_filename, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """Stream a file from Dropbox without saving it.
+        Returns (size, chunk iterator), or None if it doesn't exist or the download failed."""
+        if not self.dbx:
+            return None
+
+        try:
+            metadata, res = self._retry_transient(
+                self.dbx.files_download,
+                f"{self.folder_path}/{dropbox_filename}"
+            )
+        except ApiError as e:
+            if not (e.error.is_path() and e.error.get_path().is_not_found()):
+                print(f"❌ Dropbox download failed for {dropbox_filename}: {e}")
+            return None
+        except Exception as e:
+            print(f"❌ Error downloading {dropbox_filename}: {e}")
+            return None
+
+        def chunks():
+            try:
+                yield from res.iter_content(chunk_size)
+            finally:
+                res.close()
+
+        return metadata.size, chunks()
+
+    def get_file_metadata(self, dropbox_filename):
+        """FileMetadata (size, content_hash, ...) of a file in the Dropbox folder.
+        Returns False if it doesn't exist, None if Dropbox couldn't be reached."""
+        if not self.dbx:
+            return None
+        
+        try:
+            metadata = self._retry_transient(
+                self.dbx.files_get_metadata,
+                f"{self.folder_path}/{dropbox_filename}"
+            )
+            return metadata if isinstance(metadata, FileMetadata) else False
+        except ApiError as e:
+            if e.error.is_path() and e.error.get_path().is_not_found():
+                return False
+            print(f"⚠️ Dropbox API error checking {dropbox_filename}: {e}")
+            return None
+        except Exception as e:
+            print(f"⚠️ Error checking {dropbox_filename}: {e}")
+            return None
+    
     def file_exists(self, dropbox_filename):
         """Check if a file exists in Dropbox"""
         if not self.dbx:
@@ -155,24 +335,75 @@ class DropboxUploader:
             print(f"⚠️ Error checking file existence for {dropbox_filename}: {e}")
             return False
     
+    def list_folder(self, cursor=None):
+        """All entries of the folder - or, given a cursor, the changes since it - following every page.
+        Returns (entries, cursor for the next call). Raises on errors: a partial listing would make
+        the missing clips look deleted."""
+        if cursor:
+            result = self._retry_transient(self.dbx.files_list_folder_continue, cursor)
+        else:
+            result = self._retry_transient(self.dbx.files_list_folder, self.folder_path)
+        entries = list(result.entries)
+        while result.has_more:
+            result = self._retry_transient(self.dbx.files_list_folder_continue, result.cursor)
+            entries.extend(result.entries)
+        return entries, result.cursor
+    
+    def list_audio_files(self):
+        """(names of all clips, cursor) from a complete listing; ([], None) if the folder doesn't exist"""
+        try:
+            entries, cursor = self.list_folder()
+        except ApiError as e:
+            if e.error.is_path() and e.error.get_path().is_not_found():
+                return [], None
+            raise
+        names = [
+            entry.name for entry in entries
+            if isinstance(entry, FileMetadata) and entry.name.endswith(AUDIO_EXTENSIONS)
+        ]
+        return names, cursor
+    
+    def list_changes(self, cursor):
+        """(names of clips deleted since cursor, new cursor), or None if the cursor can't be
+        continued (expired by Dropbox, or the folder itself was deleted) and a full listing is needed"""
+        try:
+            entries, cursor = self.list_folder(cursor)
+        except ApiError as e:
+            if e.error.is_reset() or e.error.is_path():
+                return None
+            raise
+        # Entries are applied in order: a clip deleted and then re-added is still there
+        deleted = {}  # path_lower -> name
+        for entry in entries:
+            if isinstance(entry, DeletedMetadata):
+                if entry.path_lower == self.folder_path.lower():
+                    return None
+                if entry.name.endswith(AUDIO_EXTENSIONS):
+                    deleted[entry.path_lower] = entry.name
+            elif isinstance(entry, FileMetadata):
+                deleted.pop(entry.path_lower, None)
+        return set(deleted.values()), cursor
+    
+    def wait_for_changes(self, cursor, timeout=30):
+        """Block until the folder changes after cursor or timeout seconds pass (longpoll).
+        Returns (changes, backoff seconds or None), or None if the call failed."""
+        try:
+            result = self.dbx.files_list_folder_longpoll(cursor, timeout=timeout)
+        except Exception as e:
+            print(f"⚠️ Dropbox longpoll failed: {e}")
+            return None
+        return result.changes, result.backoff
+    
     def get_audio_files(self):
-        """Get list of all audio files (.wav) in Dropbox folder"""
+        """Get list of all audio files (.wav/.flac/.opus) in Dropbox folder, or None if listing failed"""
         if not self.dbx:
             return []
         
         try:
-            result = self._retry_on_auth_error(
-                self.dbx.files_list_folder,
-                self.folder_path
-            )
-            audio_files = [
-                entry.name for entry in result.entries 
-                if isinstance(entry, dropbox.files.FileMetadata) and entry.name.endswith('.wav')
-            ]
-            return audio_files
+            return self.list_audio_files()[0]
         except Exception as e:
             print(f"❌ Error listing audio files: {e}")
-            return []
+            return None
     
     def upload_directory(self, directory_path):
         """Upload all files from a directory"""
@@ -197,12 +428,8 @@ class DropboxUploader:
             return []
         
         try:
-            result = self._retry_on_auth_error(
-                self.dbx.files_list_folder,
-                self.folder_path
-            )
-            files = [entry.name for entry in result.entries]
-            return files
+            entries, _ = self.list_folder()
+            return [entry.name for entry in entries]
         except Exception as e:
             print(f"❌ Error listing files: {e}")
             return []
@@ -0,0 +1,166 @@
+"""
+Incremental reconciliation of the recordings with the clips in Dropbox.
+
+Clips deleted from the Dropbox folder (e.g. while curating the dataset)
+have their metadata rows dropped and their sentences put back into the
+pool. Instead of listing the whole folder on every boot, the reconciler
+keeps a Dropbox list_folder cursor and only asks for the changes since
+then (files_list_folder_continue); the full, paginated listing is only
+needed the first time and whenever Dropbox expires the cursor.
+
+It runs as a background task after startup and then every
+DROPBOX_SYNC_INTERVAL seconds, or - with DROPBOX_LONGPOLL - as soon as
+Dropbox reports a change. The cursor file is part of the state snapshot,
+so a fresh instance restored from Dropbox continues from the backed-up
+cursor as well.
+
+Settings (environment variables):
+- DROPBOX_SYNC_INTERVAL: seconds between reconciliations (default: 300)
+- DROPBOX_LONGPOLL: wait for changes with files_list_folder_longpoll between runs (default: false)
+- DROPBOX_LONGPOLL_TIMEOUT: seconds per longpoll request, 30-480 (default: 30); shutdown may wait for
+  a pending request
+"""
+
+import asyncio
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class DropboxReconciler:
+    def __init__(self, cursor_file, known_clips, remove_clips, interval=300.0, longpoll=False,
+                 longpoll_timeout=30, lock_file=None):
+        """known_clips() returns the clip filenames that should be in Dropbox by now (recorded and
+        not waiting for upload) and is called on the event loop; remove_clips(filenames) is a
+        coroutine function that drops deleted clips and returns how many rows it removed.
+        lock_file lets only one of several workers reconcile at a time."""
+        self.cursor_file = cursor_file
+        self.known_clips = known_clips
+        self.remove_clips = remove_clips
+        self.interval = interval
+        self.longpoll = longpoll
+        self.longpoll_timeout = longpoll_timeout
+        self.lock_file = lock_file
+        self.uploader = None
+        self._task = None
+        self._running = asyncio.Lock()  # one run at a time within this process
+
+    @classmethod
+    def from_env(cls, cursor_file, known_clips, remove_clips, lock_file=None):
+        return cls(
+            cursor_file,
+            known_clips,
+            remove_clips,
+            interval=float(os.getenv('DROPBOX_SYNC_INTERVAL', '300')),
+            longpoll=os.getenv('DROPBOX_LONGPOLL', 'false').lower() == 'true',
+            longpoll_timeout=min(max(int(os.getenv('DROPBOX_LONGPOLL_TIMEOUT', '30')), 30), 480),
+            lock_file=lock_file,
+        )
+
+    def load_cursor(self):
+        """Saved cursor for the current folder, or None"""
+        try:
+            with open(self.cursor_file, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if saved.get("folder") != self.uploader.folder_path:
+            return None
+        return saved.get("cursor")
+
+    def save_cursor(self, cursor):
+        if not cursor:
+            if os.path.exists(self.cursor_file):
+                os.remove(self.cursor_file)
+            return
+        tmp_path = f"{self.cursor_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"folder": self.uploader.folder_path, "cursor": cursor, "updated_at": time.time()}, f)
+        os.replace(tmp_path, self.cursor_file)
+
+    async def find_deleted(self):
+        """Clips deleted from Dropbox and the cursor to continue from"""
+        cursor = self.load_cursor()
+        if cursor:
+            changes = await asyncio.to_thread(self.uploader.list_changes, cursor)
+            if changes is not None:
+                return changes
+            print("🔄 Dropbox cursor can't be continued - listing the whole folder")
+
+        # Taken on the event loop before the listing, so clips recorded or uploaded meanwhile
+        # are not judged by it (a submission adds its row and its upload job without yielding)
+        known = self.known_clips()
+        names, cursor = await asyncio.to_thread(self.uploader.list_audio_files)
+        print(f"📁 Found {len(names)} audio files in Dropbox")
+        return known - set(names), cursor
+
+    def _try_lock(self):
+        """Open lock file held for one run, None if another worker is reconciling"""
+        if not self.lock_file or fcntl is None:
+            return open(os.devnull)
+        f = open(self.lock_file, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    async def reconcile(self):
+        """One reconciliation (also run on demand, e.g. before an export); returns the number of
+        clips removed"""
+        async with self._running:
+            lock = self._try_lock()
+            if lock is None:
+                return 0
+            with lock:
+                deleted, cursor = await self.find_deleted()
+                removed = await self.remove_clips(deleted) if deleted else 0
+                # Saved after the removal, so a backed-up cursor never skips changes missing from the metadata
+                self.save_cursor(cursor)
+            return removed
+
+    async def _wait(self):
+        """Sleep until the next run: the interval, cut short by a longpoll reporting changes"""
+        deadline = time.monotonic() + self.interval
+        cursor = self.load_cursor() if self.longpoll else None
+        while cursor and time.monotonic() < deadline:
+            result = await asyncio.to_thread(self.uploader.wait_for_changes, cursor, self.longpoll_timeout)
+            if result is None:
+                break
+            changes, backoff = result
+            if backoff:
+                await asyncio.sleep(backoff)
+            if changes:
+                return
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the old cursor - the next run retries from there
+                print(f"⚠️ Dropbox reconciliation failed: {e}")
+            await self._wait()
+
+    def start(self, uploader):
+        """Start reconciling in the background (first run right away)"""
+        self.uploader = uploader
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
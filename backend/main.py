@@ -1,44 +1,77 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, Request, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import json
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
+import hashlib
 import os
 import time
 import random
 import string
 import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-# Try to import pydub for audio conversion (optional)
-try:
-    from pydub import AudioSegment
-    AUDIO_CONVERSION_ENABLED = True
-    print("✅ Audio conversion enabled (pydub available)")
-except ImportError:
-    AUDIO_CONVERSION_ENABLED = False
-    print("⚠️ Audio conversion disabled (pydub not available - files will be saved as-is)")
-
-# Import Google Drive helper (optional)
-try:
-    from google_drive_helper import GoogleDriveUploader
-    GOOGLE_DRIVE_ENABLED = True
-except ImportError:
-    GOOGLE_DRIVE_ENABLED = False
-    print("⚠️ Google Drive integration not available. Install dependencies to enable.")
-
-# Import Dropbox helper (optional)
-try:
-    from dropbox_helper import DropboxUploader
-    dropbox_uploader = DropboxUploader()
-    DROPBOX_ENABLED = dropbox_uploader.dbx is not None
-    if DROPBOX_ENABLED:
-        print("✅ Dropbox backup enabled")
-except ImportError:
-    DROPBOX_ENABLED = False
-    dropbox_uploader = None
-    print("⚠️ Dropbox integration not available")
+from dotenv import load_dotenv
+
+# Settings from .env, loaded before the local modules are imported: some of them read the
+# environment at import time (e.g. transcoder's FFMPEG_BINARY)
+load_dotenv()
+
+from metadata_index import MetadataIndex, clip_number
+from storage import FileStorage, SQLiteStorage, create_storage
+from upload_outbox import UploadOutbox
+from transcoder import CLIP_CODECS, Transcoder, TranscoderBusy, TranscodeTimeout, TranscodeError, ffmpeg_available
+from audio_format import sniff_audio_format
+from request_limits import MaxBodySizeMiddleware, MultipartUpload
+from snapshot_debouncer import SnapshotDebouncer
+from sentence_scheduler import SentenceScheduler
+from sentence_leases import SQLiteLeaseStore
+from shared_state import SharedStateSync, exclusive_startup, shared_state_enabled
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from audio_quality import QualityChecker, load_numpy, read_pcm
+from silence_trim import SilenceTrimmer
+import dataset_export
+from readiness import Readiness, ReadinessMiddleware
+from dropbox_reconciler import DropboxReconciler
+from submission_dedup import InflightSubmissions, valid_idempotency_key
+
+# Audio conversion needs the ffmpeg binary (optional)
+AUDIO_CONVERSION_ENABLED = ffmpeg_available()
+if AUDIO_CONVERSION_ENABLED:
+    print("✅ Audio conversion enabled (ffmpeg available)")
+else:
+    print("⚠️ Audio conversion disabled (ffmpeg not available - files will be saved as-is)")
+
+# Quality analysis of each clip before it is accepted (needs NumPy, optional)
+QUALITY_CHECKS_ENABLED = QualityChecker.enabled()
+quality_checker = QualityChecker.from_env()
+if not QUALITY_CHECKS_ENABLED:
+    print("⚠️ Audio quality checks disabled")
+
+# Trim leading/trailing silence from clips before they are stored (optional, needs NumPy)
+SILENCE_TRIM_ENABLED = SilenceTrimmer.enabled()
+silence_trimmer = SilenceTrimmer.from_env()
+
+# Dropbox / Google Drive are imported and connected during the background warm-up
+# (see connect_integrations): their SDK imports and the connection round trips
+# would otherwise delay the server from listening after a cold start
+DROPBOX_ENABLED = False
+dropbox_uploader = None
+drive_uploader = None
 
 app = FastAPI()
 
+# Until the startup restore finishes only these endpoints are served (see readiness.py);
+# added before CORS so the 503s carry CORS headers too
+readiness = Readiness()
+warmup_task = None
+app.add_middleware(ReadinessMiddleware, readiness=readiness, allow_paths=["/", "/health", "/metrics", "/upload_status"])
+
+# Reject oversized recordings while they are still being received (also before CORS, so the
+# browser can read the 413 instead of seeing a network error)
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(25 * 1024 * 1024)))
+app.add_middleware(MaxBodySizeMiddleware, max_body_size=MAX_UPLOAD_BYTES, paths=["/submit_recording"])
+
 # Enable CORS for frontend communication
 app.add_middleware(
     CORSMiddleware,
@@ -53,222 +86,357 @@ SENTENCES_FILE = "sentences.txt"
 STATE_FILE = "sentence_state.json"
 METADATA_FILE = "metadata.csv"
 CLIPS_DIR = "clips"
+CURSOR_FILE = "dropbox_cursor.json"
+OUTBOX_DIR = os.getenv('UPLOAD_OUTBOX_DIR', 'outbox')
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '2'))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv('SHUTDOWN_DRAIN_SECONDS', '10'))
 
 # Ensure clips directory exists
 os.makedirs(CLIPS_DIR, exist_ok=True)
 
+# Recordings/state storage backend (files or SQLite, see storage.py)
+storage = create_storage(STATE_FILE, METADATA_FILE)
+
+# Several workers/instances sharing one SQLite database (see shared_state.py)
+SHARED_STATE = shared_state_enabled()
+if SHARED_STATE and not isinstance(storage, SQLiteStorage):
+    raise RuntimeError("SHARED_STATE=true requires STORAGE_BACKEND=sqlite")
+
+# Process-wide index over the metadata (loaded at startup, updated on each submission)
+metadata_index = MetadataIndex()
+
 # Initialize state file if it doesn't exist
 def init_state():
-    if not os.path.exists(STATE_FILE):
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump({"recorded": []}, f, ensure_ascii=False)
-    
-    # Initialize metadata CSV if it doesn't exist
-    if not os.path.exists(METADATA_FILE):
-        with open(METADATA_FILE, "w", encoding="utf-8") as f:
-            f.write("filename|sentence\n")
-
-# Load sentences from file
-def load_sentences():
-    if not os.path.exists(SENTENCES_FILE):
-        return []
-    with open(SENTENCES_FILE, "r", encoding="utf-8") as f:
-        return [line.strip() for line in f if line.strip()]
+    storage.init()
 
 # Load recorded state
 def load_state():
-    with open(STATE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return storage.load_state()
 
 # Save recorded state
 def save_state(state):
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    storage.save_state(state)
+
+# Pool of unrecorded sentences (reloaded only when sentences.txt changes)
+scheduler = SentenceScheduler(
+    SENTENCES_FILE,
+    lambda: load_state().get("recorded", []),
+    lease_store=SQLiteLeaseStore(storage.db_file) if SHARED_STATE else None,
+    lease_ttl=float(os.getenv('SENTENCE_LEASE_TTL', '300'))
+)
+
+# Catches this worker's caches up with rows written by other workers
+shared_state = SharedStateSync(storage, metadata_index, scheduler) if SHARED_STATE else None
+
+def sync_shared_state():
+    """Apply recordings made by other workers (no-op with a single worker)"""
+    if shared_state:
+        shared_state.sync()
+
+# Write the current state/metadata files (exported from the database when using SQLite)
+def export_state_files():
+    storage.export_files()
 
 # Count total recordings from metadata.csv (source of truth)
 def count_total_recordings():
     """Count total number of recordings from metadata.csv"""
-    if not os.path.exists(METADATA_FILE):
-        return 0
-    
-    try:
-        with open(METADATA_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()[1:]  # Skip header
-            return len([line for line in lines if line.strip() and '|' in line])
-    except Exception as e:
-        print(f"⚠️ Error counting recordings: {e}")
-        return 0
+    return metadata_index.total_recordings()
 
 # Count unique sentences recorded from metadata.csv
 def count_unique_sentences_recorded():
     """Count unique sentences that have been recorded from metadata.csv"""
-    if not os.path.exists(METADATA_FILE):
-        return set()
-    
+    return metadata_index.unique_sentences()
+
+def reload_caches():
+    """Rebuild the in-memory metadata index and sentence pool from storage"""
+    if shared_state:
+        shared_state.reload()
+    else:
+        metadata_index.load(storage.iter_recordings())
+        scheduler.reload()
+
+def sync_recorded_state():
+    """Mark exactly the sentences that have a recording as recorded (e.g. after metadata.csv was lost)"""
+    state = load_state()
+    sentences_in_metadata = {sentence for _, sentence in storage.iter_recordings()}
+    if set(state.get("recorded", [])) != sentences_in_metadata:
+        removed_count = len(set(state.get("recorded", [])) - sentences_in_metadata)
+        state["recorded"] = list(sentences_in_metadata)
+        save_state(state)
+        print(f"✅ Updated state: removed {removed_count} entries without audio files")
+        return True
+    return False
+
+def known_clips():
+    """Clips that should be in Dropbox by now: recorded, and not waiting in the upload outbox"""
+    pending = {os.path.basename(path) for path in outbox.pending_paths()}
+    return {os.path.basename(filepath) for filepath, _ in storage.iter_recordings()} - pending
+
+async def remove_deleted_clips(filenames):
+    """Forget the recordings whose clips were deleted from Dropbox and back up the new metadata.
+    The storage rewrite runs in a thread; the in-memory caches are updated row by row."""
+    removed = await asyncio.to_thread(storage.remove_recordings, filenames)
+    if removed:
+        print(f"🗑️ Removed {len(removed)} recordings whose clips were deleted from Dropbox")
+        if shared_state:
+            # Applied from the removals log, like removals made by other workers
+            shared_state.sync(force=True)
+        else:
+            for filepath, sentence, sentence_id in removed:
+                if metadata_index.remove(filepath, sentence):
+                    scheduler.unmark_recorded(sentence, sentence_id)
+        snapshot_debouncer.note_change(len(removed))
+    return len(removed)
+
+def upload_to_dropbox(path):
+    return dropbox_uploader.upload_file(path)
+
+def upload_state_snapshot(path):
+    # Exported here, in the upload worker thread: with SQLite this rewrites every file from the
+    # database, which would block the event loop for seconds on a large corpus
+    export_state_files()
+    # metadata.csv, sentence_state.json, quality.csv, the clip sequence and the reconciliation cursor
+    # are committed together in one batch
+    paths = [METADATA_FILE, STATE_FILE]
+    paths.extend(path for path in (storage.quality_file, storage.sequence_file, CURSOR_FILE) if os.path.exists(path))
+    return dropbox_uploader.upload_files_batch(paths)
+
+def upload_to_drive(path):
+    return drive_uploader.upload_file(path, folder_id=drive_uploader.folder_id) is not None
+
+def connect_dropbox():
+    global dropbox_uploader, DROPBOX_ENABLED
     try:
-        unique_sentences = set()
-        with open(METADATA_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()[1:]  # Skip header
-            for line in lines:
-                if line.strip() and '|' in line:
-                    _, sentence = line.strip().split('|', 1)
-                    unique_sentences.add(sentence)
-        return unique_sentences
-    except Exception as e:
-        print(f"⚠️ Error counting unique sentences: {e}")
-        return set()
+        from dropbox_helper import DropboxUploader
+    except ImportError:
+        print("⚠️ Dropbox integration not available")
+        return
+    uploader = DropboxUploader()
+    if uploader.dbx is None:
+        return
+    dropbox_uploader = uploader
+    DROPBOX_ENABLED = True
+    upload_handlers["dropbox"] = upload_to_dropbox
+    upload_handlers["dropbox_snapshot"] = upload_state_snapshot
+    print("✅ Dropbox backup enabled")
 
-def sync_with_dropbox():
-    """Sync local state and metadata with Dropbox audio files.
-    Remove any entries from state/metadata if their audio file is missing from Dropbox."""
-    if not DROPBOX_ENABLED:
+def connect_drive():
+    global drive_uploader
+    if not os.path.exists('credentials.json'):
         return
-    
     try:
-        print("🔄 Syncing state with Dropbox audio files...")
-        
-        # Get list of audio files in Dropbox
-        dropbox_audio_files = set(dropbox_uploader.get_audio_files())
-        print(f"📁 Found {len(dropbox_audio_files)} audio files in Dropbox")
-        
-        if len(dropbox_audio_files) == 0:
-            # No audio files in Dropbox - reset everything
-            print("🗑️ No audio files in Dropbox - resetting state and metadata")
-            
-            with open(STATE_FILE, "w", encoding="utf-8") as f:
-                json.dump({"recorded": []}, f, ensure_ascii=False)
-            
-            with open(METADATA_FILE, "w", encoding="utf-8") as f:
-                f.write("filename|sentence\n")
-            
-            # Upload the reset files to Dropbox
-            dropbox_uploader.upload_file(STATE_FILE)
-            dropbox_uploader.upload_file(METADATA_FILE)
-            
-            print("✅ State and metadata reset and synced to Dropbox")
-            return
-        
-        # Read current metadata
-        metadata_lines = []
-        metadata_changed = False
-        sentences_in_metadata = set()
-        
-        if os.path.exists(METADATA_FILE):
-            with open(METADATA_FILE, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-                # Keep header
-                metadata_lines.append(lines[0] if lines else "filename|sentence\n")
-                
-                # Check each metadata entry
-                for line in lines[1:]:
-                    if '|' in line:
-                        filepath, sentence = line.strip().split('|', 1)
-                        filename = os.path.basename(filepath)
-                        
-                        # Only keep if audio file exists in Dropbox
-                        if filename in dropbox_audio_files:
-                            metadata_lines.append(line)
-                            sentences_in_metadata.add(sentence)
-                        else:
-                            metadata_changed = True
-                            print(f"🗑️ Removed from metadata: {filename} (missing in Dropbox)")
-        
-        # Update metadata file if changed
-        if metadata_changed or not os.path.exists(METADATA_FILE):
-            with open(METADATA_FILE, "w", encoding="utf-8") as f:
-                f.writelines(metadata_lines)
-            print("✅ Updated metadata.csv")
-            
-            # Upload updated metadata to Dropbox
-            dropbox_uploader.upload_file(METADATA_FILE)
-            print("✅ Uploaded updated metadata.csv to Dropbox")
-        
-        # Update state file - only keep sentences that have audio files
-        state = load_state()
-        original_recorded = set(state.get("recorded", []))
-        synced_recorded = list(sentences_in_metadata)
-        
-        if set(synced_recorded) != original_recorded:
-            state["recorded"] = synced_recorded
-            save_state(state)
-            
-            removed_count = len(original_recorded) - len(synced_recorded)
-            print(f"✅ Updated state: removed {removed_count} entries without audio files")
-            
-            # Upload updated state to Dropbox
-            dropbox_uploader.upload_file(STATE_FILE)
-            print("✅ Uploaded updated sentence_state.json to Dropbox")
-        
-        print(f"✅ Sync complete: {len(synced_recorded)} recordings tracked")
-        
-    except Exception as e:
-        print(f"⚠️ Error during sync: {e}")
-
-# Global Google Drive uploader instance
-drive_uploader = None
-if GOOGLE_DRIVE_ENABLED and os.path.exists('credentials.json'):
-    drive_uploader = GoogleDriveUploader()
+        from google_drive_helper import GoogleDriveUploader
+    except ImportError:
+        print("⚠️ Google Drive integration not available. Install dependencies to enable.")
+        return
+    uploader = GoogleDriveUploader()
     try:
-        if drive_uploader.authenticate():
-            drive_uploader.create_folder('Tigrigna Speech Dataset')
-            print("✅ Google Drive backup enabled")
+        if not uploader.authenticate():
+            return
+        uploader.create_folder('Tigrigna Speech Dataset')
     except Exception as e:
         print(f"⚠️ Google Drive authentication failed: {e}")
-        drive_uploader = None
+        return
+    drive_uploader = uploader
+    upload_handlers["drive"] = upload_to_drive
+    print("✅ Google Drive backup enabled")
 
-@app.on_event("startup")
-async def startup_event():
-    # First, try to restore state from Dropbox if available
-    if DROPBOX_ENABLED:
-        print("🔄 Syncing state from Dropbox...")
-        
-        # Check if state files exist in Dropbox
-        state_exists = dropbox_uploader.file_exists("sentence_state.json")
-        metadata_exists = dropbox_uploader.file_exists("metadata.csv")
-        
-        if not state_exists and not metadata_exists:
+def connect_integrations():
+    """Import and connect the cloud backends concurrently (runs in the warm-up, off the event loop)"""
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        for connected in [pool.submit(connect_dropbox), pool.submit(connect_drive)]:
+            connected.result()
+
+# Durable queue of pending cloud uploads, drained by background workers
+# (targets are registered by connect_integrations)
+upload_handlers = {}
+outbox = UploadOutbox(OUTBOX_DIR, upload_handlers, workers=UPLOAD_WORKERS, shared=SHARED_STATE)
+
+# Process pool for audio conversion (keeps ffmpeg off the event loop)
+transcoder = Transcoder.from_env()
+
+# Clips are stored compressed (FLAC by default, see CLIP_CODEC); without an encoder they stay WAV
+CLIP_CODEC = transcoder.codec if AUDIO_CONVERSION_ENABLED and transcoder.codec_available() else "wav"
+CLIP_EXTENSION = CLIP_CODECS[CLIP_CODEC][0]
+if CLIP_CODEC != transcoder.codec:
+    print(f"⚠️ Cannot encode {transcoder.codec} clips - storing WAV instead")
+else:
+    print(f"🗜️ Storing clips as {CLIP_CODEC.upper()}")
+
+def queue_state_snapshot():
+    """Queue metadata.csv / sentence_state.json for backup to Dropbox (exported when the upload runs)"""
+    if not os.path.exists(METADATA_FILE):
+        # New SQLite database, never exported - the outbox drops jobs whose file is missing
+        export_state_files()
+    outbox.enqueue("snapshot", METADATA_FILE, ["dropbox_snapshot"])
+
+# Coalesces snapshot uploads: at most once per interval or every N new rows
+snapshot_debouncer = SnapshotDebouncer.from_env(queue_state_snapshot)
+
+# Drops recordings whose clips were deleted from Dropbox, from the folder's changes since the
+# last run (started after the warm-up, see dropbox_reconciler.py)
+reconciler = DropboxReconciler.from_env(
+    CURSOR_FILE, known_clips, remove_deleted_clips,
+    lock_file=f"{storage.db_file}.reconcile.lock" if SHARED_STATE else None
+)
+
+# Prometheus metrics served on /metrics (see metrics.py)
+SUBMIT_STAGE_SECONDS = REGISTRY.histogram(
+    "recorder_submit_stage_seconds", "Time spent in each /submit_recording stage", ["stage"]
+)
+SUBMISSIONS = REGISTRY.counter("recorder_submissions_total", "/submit_recording responses by status code", ["status"])
+DUPLICATES = REGISTRY.counter(
+    "recorder_duplicate_submissions_total", "Retried submissions answered with the clip already stored", ["match"]
+)
+BYTES_IN = REGISTRY.counter("recorder_received_bytes_total", "Recording upload bytes received")
+BYTES_OUT = REGISTRY.counter("recorder_clip_bytes_total", "Bytes of stored clips written by codec", ["codec"])
+TRANSCODE_FAILURES = REGISTRY.counter("recorder_transcode_failures_total", "Failed conversions by reason", ["reason"])
+TRIMMED_SECONDS = REGISTRY.counter("recorder_trimmed_seconds_total", "Seconds of silence trimmed from clips")
+QUALITY_REJECTIONS = REGISTRY.counter("recorder_quality_rejections_total", "Clips rejected by quality checks", ["reason"])
+REGISTRY.gauge(
+    "recorder_upload_queue", "Pending cloud upload jobs",
+    lambda: {(state,): outbox.status()[state] for state in ("pending", "in_flight", "retrying")}, ["state"]
+)
+REGISTRY.gauge(
+    "recorder_upload_queue_oldest_age_seconds", "Age of the oldest pending upload job",
+    lambda: outbox.status()["oldest_age_seconds"]
+)
+REGISTRY.gauge(
+    "recorder_transcode_queue", "Conversions running or waiting for the transcoding pool",
+    lambda: transcoder.pending + transcoder.waiting
+)
+REGISTRY.gauge("recorder_sentences_available", "Unrecorded sentences free to hand out", lambda: scheduler.available)
+REGISTRY.gauge("recorder_sentence_leases", "Sentences currently reserved by speakers", lambda: scheduler.leases.count())
+
+def process_clip(path):
+    """Decode the stored clip once: measure its quality, then trim silence (rewriting the file).
+    Measured before trimming, so the silence and noise metrics describe what the speaker uploaded.
+    Returns (quality metrics or None, seconds trimmed)"""
+    clip = read_pcm(path)
+    if clip is None:
+        return None, 0.0
+    quality = quality_checker.analyze_clip(clip) if QUALITY_CHECKS_ENABLED else None
+    trimmed = 0.0
+    if SILENCE_TRIM_ENABLED and not (quality and quality_checker.problems(quality)):
+        trimmed_clip = silence_trimmer.trim(clip)
+        if trimmed_clip is not clip:
+            trimmed = clip.duration - trimmed_clip.duration
+            trimmed_clip.write(path)
+    return quality, trimmed
+
+# Dropbox name -> local path of the state files restored at startup
+def state_files():
+    return {
+        "sentence_state.json": STATE_FILE,
+        "metadata.csv": METADATA_FILE,
+        "quality.csv": storage.quality_file,
+        "clip_sequence": storage.sequence_file,
+        "dropbox_cursor.json": CURSOR_FILE,
+    }
+
+def local_metadata_files():
+    """The local metadata.csv / quality.csv (the files restore_state downloads over)"""
+    return FileStorage(STATE_FILE, METADATA_FILE, quality_file=storage.quality_file)
+
+def merge_unsnapshotted_rows(rows, clip_info):
+    """Put back local rows that the restored snapshot doesn't have yet: snapshots are debounced, so
+    after a restart that kept the disk the local metadata can be newer than the one in Dropbox.
+    Kept are rows whose clip is still waiting in the upload outbox or was numbered after the
+    snapshot's newest clip (rows only missing because they were removed from Dropbox stay gone)."""
+    restored = local_metadata_files()
+    restored_names = set()
+    newest = 0
+    for filepath, _ in restored.iter_recordings():
+        restored_names.add(os.path.basename(filepath))
+        newest = max(newest, clip_number(filepath) or 0)
+    pending = {os.path.basename(path) for path in outbox.pending_paths()}
+    merged = 0
+    for filepath, sentence in rows:
+        filename = os.path.basename(filepath)
+        if filename not in restored_names and (filename in pending or (clip_number(filename) or 0) > newest):
+            restored.append_recording(filepath, sentence, quality=clip_info.get(filename))
+            restored_names.add(filename)
+            merged += 1
+    return merged
+
+# Restore state from Dropbox (deleted clips are picked up afterwards by the reconciler)
+def restore_state():
+    if not DROPBOX_ENABLED:
+        # Initialize state if files don't exist
+        init_state()
+        return
+    
+    print("🔄 Syncing state from Dropbox...")
+    files = state_files()
+    merged = 0
+    with ThreadPoolExecutor(max_workers=len(files)) as pool:
+        # One round of concurrent requests for the metadata (incl. content_hash) of each state file
+        remote = dict(zip(files, pool.map(dropbox_uploader.get_file_metadata, files)))
+        
+        if remote["sentence_state.json"] is False and remote["metadata.csv"] is False:
             # Both files missing from Dropbox - user deleted everything, so reset
             print("🔄 No state files found in Dropbox - resetting to fresh state")
             
-            # Delete local files if they exist
-            if os.path.exists(STATE_FILE):
-                os.remove(STATE_FILE)
-            if os.path.exists(METADATA_FILE):
-                os.remove(METADATA_FILE)
-            
-            # Initialize fresh state
-            init_state()
+            # Drop local state/metadata
+            storage.reset()
             print("✅ Reset to fresh state")
+            return
+        
+        # Rows recorded since the last snapshot, merged back in after the download
+        local = local_metadata_files()
+        local_rows, local_clip_info = list(local.iter_recordings()), dict(local.iter_quality())
+        
+        # Download the files concurrently, skipping those whose local copy has the same content_hash
+        downloads = {
+            name: pool.submit(dropbox_uploader.download_file, name, files[name], metadata.content_hash)
+            for name, metadata in remote.items() if metadata
+        }
+        for name, metadata in remote.items():
+            if metadata is False and name not in ("quality.csv", "clip_sequence"):
+                # File doesn't exist in Dropbox, reset it (quality.csv / clip_sequence are optional - older backups don't have them)
+                print(f"⚠️ {name} not in Dropbox - creating fresh")
+                if os.path.exists(files[name]):
+                    os.remove(files[name])
+        for name, download in downloads.items():
+            if download.result():
+                print(f"✅ Restored {name} from Dropbox")
+        if remote["metadata.csv"]:
+            merged = merge_unsnapshotted_rows(local_rows, local_clip_info)
+            if merged:
+                print(f"✅ Kept {merged} local recordings newer than the Dropbox snapshot")
+    
+    # Initialize state if files don't exist
+    init_state()
+    
+    # A fresh SQLite database picks up the restored files
+    if isinstance(storage, SQLiteStorage) and storage.is_empty():
+        imported_rows, imported_sentences = storage.import_files()
+        print(f"✅ Imported {imported_rows} recordings and {imported_sentences} sentences into SQLite")
+    
+    # The restored state and metadata may disagree if only one of them was backed up
+    if sync_recorded_state() or merged:
+        queue_state_snapshot()
+
+def load_initial_state():
+    """Restore from Dropbox (first worker only when shared), then build the in-memory caches"""
+    try:
+        if SHARED_STATE:
+            # Only the first worker on a fresh database restores from Dropbox; the others use the shared state
+            with exclusive_startup(f"{storage.db_file}.startup.lock"):
+                if storage.is_empty():
+                    restore_state()
+                else:
+                    init_state()
         else:
-            # Try to download sentence_state.json
-            state_downloaded = dropbox_uploader.download_file("sentence_state.json", STATE_FILE)
-            if state_downloaded:
-                print("✅ Restored sentence_state.json from Dropbox")
-            elif state_downloaded is False:
-                # File doesn't exist in Dropbox, reset it
-                print("⚠️ sentence_state.json not in Dropbox - creating fresh")
-                if os.path.exists(STATE_FILE):
-                    os.remove(STATE_FILE)
-            
-            # Try to download metadata.csv
-            metadata_downloaded = dropbox_uploader.download_file("metadata.csv", METADATA_FILE)
-            if metadata_downloaded:
-                print("✅ Restored metadata.csv from Dropbox")
-            elif metadata_downloaded is False:
-                # File doesn't exist in Dropbox, reset it
-                print("⚠️ metadata.csv not in Dropbox - creating fresh")
-                if os.path.exists(METADATA_FILE):
-                    os.remove(METADATA_FILE)
-            
-            # Initialize state if files don't exist
-            init_state()
-            
-            # Now sync with actual audio files in Dropbox
-            sync_with_dropbox()
-    else:
-        # Initialize state if files don't exist
+            restore_state()
+    except Exception as e:
+        # Serve the local state rather than not at all; the next start retries (unchanged files are skipped)
+        print(f"⚠️ Error restoring state from Dropbox: {e}")
         init_state()
     
+    # Build the in-memory metadata index and sentence pool once; submissions keep them up to date
+    reload_caches()
+    
     # Log current stats
     try:
         state = load_state()
@@ -277,6 +445,53 @@ async def startup_event():
     except Exception as e:
         print(f"⚠️ Error loading state: {e}")
 
+async def warm_up():
+    try:
+        await asyncio.to_thread(connect_integrations)
+        await asyncio.to_thread(load_initial_state)
+        if QUALITY_CHECKS_ENABLED or SILENCE_TRIM_ENABLED:
+            # Imported here rather than at startup, but before the first submission needs it
+            await asyncio.to_thread(load_numpy)
+    except Exception as e:
+        # /health keeps reporting "warming" - the server can't serve without its state
+        print(f"❌ Startup failed: {e}")
+        raise
+    # Uploads start after the restore, so a snapshot can't overwrite the state being restored
+    await outbox.start()
+    if DROPBOX_ENABLED:
+        reconciler.start(dropbox_uploader)
+    readiness.set_ready()
+    print(f"✅ Ready after {readiness.warmup_seconds}s warm-up")
+
+@app.on_event("startup")
+async def startup_event():
+    global warmup_task
+    # Fork the transcoding workers before any background threads exist
+    if AUDIO_CONVERSION_ENABLED:
+        transcoder.start()
+    
+    # Pending uploads from a previous run (their clips are not in Dropbox yet)
+    outbox.load()
+    
+    # Connect the cloud backends and restore in the background so the server answers right away
+    # (/health reports "warming" meanwhile)
+    warmup_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if warmup_task and not warmup_task.done():
+        # Still restoring - nothing recorded yet, so nothing to flush
+        warmup_task.cancel()
+        transcoder.shutdown()
+        return
+    await reconciler.stop()
+    # Final snapshot of anything recorded since the last one, then give uploads a moment to finish
+    snapshot_debouncer.flush()
+    if not await outbox.drain(SHUTDOWN_DRAIN_SECONDS):
+        print(f"⚠️ {outbox.status()['pending']} uploads still pending at shutdown - they will resume on next start")
+    await outbox.stop()
+    transcoder.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Tigrigna Speech Collection API", "version": "1.0"}
@@ -284,6 +499,13 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Check if the system is ready to accept recordings"""
+    if not readiness.ready:
+        return {
+            "status": "warming",
+            "message": "Connecting to Dropbox and restoring state - ready in a moment",
+            "dropbox_connected": DROPBOX_ENABLED
+        }
+    
     if not DROPBOX_ENABLED:
         return {
             "status": "unavailable",
@@ -294,54 +516,51 @@ async def health_check():
     return {
         "status": "ready",
         "message": "System is ready to accept recordings",
-        "dropbox_connected": True
+        "dropbox_connected": True,
+        "warmup_seconds": readiness.warmup_seconds
     }
 
+@app.get("/upload_status")
+async def get_upload_status():
+    """Pending cloud uploads: queue depth and age of the oldest item"""
+    return outbox.status()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics (per worker process)"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/stats")
 async def get_stats():
     """Get recording statistics"""
-    sentences = load_sentences()
-    state = load_state()
-    recorded = state.get("recorded", [])
+    sync_shared_state()
+    scheduler.refresh()
+    total = scheduler.total
+    recorded = total - scheduler.remaining
     
     return {
-        "total_sentences": len(sentences),
+        "total_sentences": total,
         "recorded_count": count_total_recordings(),
-        "remaining_count": len(sentences) - len(recorded),
-        "progress_percent": round((len(recorded) / len(sentences) * 100), 2) if sentences else 0
+        "remaining_count": scheduler.remaining,
+        "progress_percent": round((recorded / total * 100), 2) if total else 0
     }
 
 @app.get("/speaker_stats/{speaker_name}")
 async def get_speaker_stats(speaker_name: str):
-    """Get statistics for a specific speaker by counting their recordings in metadata.csv"""
+    """Get statistics for a specific speaker from the metadata index"""
+    sync_shared_state()
     try:
-        if not os.path.exists(METADATA_FILE):
-            return {
-                "speaker": speaker_name,
-                "recording_count": 0,
-                "recordings": []
-            }
-        
         # Sanitize speaker name the same way as in filename generation
         sanitized_speaker = ''.join(c if c.isalnum() or c == '_' else '_' for c in speaker_name)
         sanitized_speaker = sanitized_speaker.strip('_')
         
-        speaker_recordings = []
-        
-        # Read metadata.csv and count files that start with the speaker's name
-        with open(METADATA_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()[1:]  # Skip header
-            for line in lines:
-                if '|' in line:
-                    filepath, sentence = line.strip().split('|', 1)
-                    filename = os.path.basename(filepath)
-                    
-                    # Check if filename starts with speaker's sanitized name
-                    if filename.startswith(f"{sanitized_speaker}_"):
-                        speaker_recordings.append({
-                            "filename": filename,
-                            "sentence": sentence[:50] + "..." if len(sentence) > 50 else sentence
-                        })
+        speaker_recordings = [
+            {
+                "filename": filename,
+                "sentence": sentence[:50] + "..." if len(sentence) > 50 else sentence
+            }
+            for filename, sentence in metadata_index.speaker_recordings(sanitized_speaker)
+        ]
         
         return {
             "speaker": speaker_name,
@@ -355,32 +574,12 @@ async def get_speaker_stats(speaker_name: str):
 @app.get("/all_speakers")
 async def get_all_speakers():
     """Get a list of all speakers and their recording counts"""
+    sync_shared_state()
     try:
-        if not os.path.exists(METADATA_FILE):
-            return {"speakers": []}
-        
-        speaker_counts = {}
-        
-        # Read metadata.csv and extract speaker names from filenames
-        with open(METADATA_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()[1:]  # Skip header
-            for line in lines:
-                if '|' in line:
-                    filepath, _ = line.strip().split('|', 1)
-                    filename = os.path.basename(filepath)
-                    
-                    # Extract speaker name from filename (format: speaker_num_timestamp_id.wav)
-                    if '_' in filename:
-                        parts = filename.split('_')
-                        # Check if it has speaker prefix (at least 4 parts: speaker, num, timestamp, id)
-                        if len(parts) >= 4:
-                            speaker_name = parts[0]
-                            speaker_counts[speaker_name] = speaker_counts.get(speaker_name, 0) + 1
-        
         # Convert to list and sort by count (descending)
         speakers_list = [
             {"name": name, "count": count}
-            for name, count in speaker_counts.items()
+            for name, count in metadata_index.speaker_counts().items()
         ]
         speakers_list.sort(key=lambda x: x["count"], reverse=True)
         
@@ -390,48 +589,62 @@ async def get_all_speakers():
         raise HTTPException(status_code=500, detail=f"Error getting all speakers: {str(e)}")
 
 @app.get("/next_sentence")
-async def get_next_sentence():
-    """Get the next unrecorded sentence"""
-    sentences = load_sentences()
-    if not sentences:
+async def get_next_sentence(speaker: str = None, client: str = None):
+    """Get the next unrecorded sentence, reserved for this client (browser tab) or speaker for
+    SENTENCE_LEASE_TTL seconds; anonymous callers get a sentence without a reservation"""
+    sync_shared_state()
+    scheduler.refresh()
+    if not scheduler.total:
         raise HTTPException(status_code=404, detail="No sentences found. Please add sentences.txt file.")
     
-    state = load_state()
-    recorded = set(state.get("recorded", []))
-    
-    print(f"📊 Total sentences: {len(sentences)}, Already recorded: {len(recorded)}")
-    
-    # Find unrecorded sentences
-    unrecorded = [s for s in sentences if s not in recorded]
+    # Random unrecorded sentence in O(1), leased so other speakers don't get it too.
+    # The client token outlives page reloads, so a reload releases the tab's previous lease.
+    holder = f"client:{client[:128]}" if client else speaker or None
+    leased = scheduler.lease(holder)
     
-    print(f"📋 Unrecorded sentences remaining: {len(unrecorded)}")
-    
-    if not unrecorded:
+    if leased is None:
+        if scheduler.remaining:
+            return {
+                "sentence": None,
+                "message": "All remaining sentences are being recorded by other speakers. Please try again shortly.",
+                "remaining": scheduler.remaining,
+                "completed": False
+            }
         return {
             "sentence": None,
             "message": "All sentences have been recorded! 🎉",
             "completed": True
         }
     
-    # Return a random unrecorded sentence
-    sentence = random.choice(unrecorded)
-    
-    print(f"✅ Selected sentence: {sentence[:50]}...")
-    
+    sentence_id, sentence = leased
     return {
         "sentence": sentence,
-        "remaining": len(unrecorded),
+        "sentence_id": sentence_id,
+        "remaining": scheduler.remaining,
+        "lease_seconds": scheduler.lease_ttl if holder else 0,
         "completed": False
     }
 
+# Submissions still being processed, so a retry arriving meanwhile waits for the original
+inflight_submissions = InflightSubmissions()
+
+def submission_key(field, value, sentence):
+    """In-flight key of a submission; content hashes only match for the same sentence, as the
+    same audio sent for another sentence is stored as a recording of its own"""
+    return (field, (value, sentence) if field == "upload_sha256" else value)
+
+async def find_duplicate(field, value, sentence):
+    """(filename, sentence) already stored - or being stored - from an upload with this
+    idempotency_key / upload_sha256, or None"""
+    found = await inflight_submissions.wait([submission_key(field, value, sentence)])
+    return found or storage.find_upload(**{field: value}, sentence=sentence)
+
 @app.post("/submit_recording")
-async def submit_recording(
-    audio: UploadFile = File(...),
-    sentence: str = Form(...),
-    speaker: str = Form(None)
-):
-    """Save audio recording and update metadata"""
-    temp_path = None
+async def submit_recording(request: Request, idempotency_key: str = Header(None)):
+    """Save audio recording and update metadata (multipart form: audio, sentence, speaker, sentence_id)"""
+    started = time.perf_counter()
+    temp_path = wav_path = filepath = None
+    submission = stored = None
     try:
         # CHECK DROPBOX CONNECTION FIRST - Block recording if Dropbox is not available
         if not DROPBOX_ENABLED:
@@ -440,6 +653,30 @@ async def submit_recording(
                 detail="Dropbox connection is unavailable. Recording is disabled. Please try again later."
             )
         
+        if idempotency_key is not None and not valid_idempotency_key(idempotency_key):
+            raise HTTPException(status_code=400, detail="Invalid Idempotency-Key header.")
+        
+        # Parse the multipart body as it arrives, writing the audio part straight to the
+        # staging file (hashing it on the way) - the upload is never spooled anywhere else
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".upload") as temp_file, \
+                SUBMIT_STAGE_SECONDS.time(stage="body_read"):
+            temp_path = temp_file.name
+            form = MultipartUpload("audio", temp_file, MAX_UPLOAD_BYTES, digest=digest)
+            BYTES_IN.inc(await form.parse(request))
+        if not form.has_file:
+            raise HTTPException(status_code=422, detail="Missing form field: audio")
+        sentence = form.fields.get("sentence")
+        if sentence is None:
+            raise HTTPException(status_code=422, detail="Missing form field: sentence")
+        speaker = form.fields.get("speaker") or None
+        sentence_id = form.fields.get("sentence_id") or None
+        if sentence_id is not None:
+            try:
+                sentence_id = int(sentence_id)
+            except ValueError:
+                raise HTTPException(status_code=422, detail="sentence_id must be an integer.")
+        
         # Validate speaker name format (backend validation as extra safety)
         if speaker:
             # Check for invalid characters
@@ -463,15 +700,32 @@ async def submit_recording(
                     detail="Speaker name must be 30 characters or less."
                 )
         
+        upload = {"idempotency_key": idempotency_key, "upload_sha256": digest.hexdigest()}
+        
+        # A retry of a submission that was stored (or is being stored) gets the original clip back
+        for field, value in upload.items():
+            duplicate = value and await find_duplicate(field, value, sentence)
+            if duplicate:
+                os.unlink(temp_path)
+                DUPLICATES.inc(match=field)
+                SUBMISSIONS.inc(status="200")
+                print(f"♻️ Duplicate submission ({field}) - already saved as {duplicate[0]}")
+                return {
+                    "success": True,
+                    "filename": duplicate[0],
+                    "duplicate": True,
+                    "message": "Recording saved successfully!"
+                }
+        submission_keys = [submission_key(field, value, sentence) for field, value in upload.items() if value]
+        submission = inflight_submissions.begin(submission_keys)
+        
         # Generate unique filename
         timestamp = int(time.time())
         random_id = ''.join(random.choices(string.ascii_lowercase + string.digits, k=4))
         
-        # Use metadata.csv count for sentence number (source of truth for total recordings)
-        sentence_num = count_total_recordings() + 1
-        
-        # Load state for later use
-        state = load_state()
+        # Atomic, persistent sequence so concurrent submissions and workers never share a number;
+        # the highest clip number in the metadata is a floor in case the counter is behind restored metadata
+        sentence_num = storage.next_clip_number(metadata_index.highest_clip_number())
         
         # Sanitize speaker name for filename (remove special characters)
         speaker_prefix = ""
@@ -482,106 +736,235 @@ async def submit_recording(
             if sanitized_speaker:
                 speaker_prefix = f"{sanitized_speaker}_"
         
-        # Always use .wav extension with speaker prefix
-        filename = f"{speaker_prefix}{sentence_num}_{timestamp}_{random_id}.wav"
+        # Extension of the storage codec, with speaker prefix
+        stem = f"{speaker_prefix}{sentence_num}_{timestamp}_{random_id}"
+        filename = f"{stem}{CLIP_EXTENSION}"
         filepath = os.path.join(CLIPS_DIR, filename)
-        
-        # Read audio content
-        audio_content = await audio.read()
-        
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_file:
-            temp_file.write(audio_content)
-            temp_path = temp_file.name
-        
-        if AUDIO_CONVERSION_ENABLED:
-            # Try to convert from WebM format (most common browser format)
-            try:
-                audio_segment = AudioSegment.from_file(temp_path, format="webm")
-                print(f"Successfully loaded as WebM format")
-            except:
-                # Fallback: Try OGG format
-                try:
-                    audio_segment = AudioSegment.from_file(temp_path, format="ogg")
-                    print(f"Successfully loaded as OGG format")
-                except Exception as e:
-                    # Last resort: let pydub auto-detect
-                    audio_segment = AudioSegment.from_file(temp_path)
-                    print(f"Auto-detected format")
+        # Canonical PCM WAV that is trimmed/analyzed before being encoded for storage
+        wav_path = filepath if CLIP_CODEC == "wav" else os.path.join(CLIPS_DIR, f"{stem}.wav")
+        analyze = QUALITY_CHECKS_ENABLED or SILENCE_TRIM_ENABLED
+        
+        # Pick the decoder from the file header instead of trying formats one by one
+        input_format = sniff_audio_format(temp_path)
+        
+        codec = CLIP_CODEC
+        quality = None
+        try:
+            if input_format == "wav" and transcoder.matches_target(temp_path):
+                # Already in the canonical clip format - no transcode needed (stored byte-for-byte as WAV)
+                shutil.move(temp_path, wav_path)
+                temp_path = None
+                print(f"Saved PCM WAV upload as-is: {wav_path}")
+            elif AUDIO_CONVERSION_ENABLED:
+                # Convert to canonical WAV in the transcoding pool; with nothing to analyze,
+                # go straight to the storage codec in the same ffmpeg run
+                target, target_codec = (wav_path, "wav") if analyze else (filepath, CLIP_CODEC)
+                with SUBMIT_STAGE_SECONDS.time(stage="transcode"):
+                    await transcoder.convert(temp_path, target, input_format, codec=target_codec)
+                print(f"Saved as {transcoder.sample_rate} Hz {target_codec.upper()}: {target}")
+            else:
+                # Save the file as-is
+                shutil.move(temp_path, filepath)
+                temp_path = None
+                codec = input_format or "unknown"
+                print(f"Saved as-is: {filepath}")
             
-            # Export as proper WAV file
-            audio_segment.export(filepath, format="wav")
-            print(f"Saved as proper WAV: {filepath}")
-        else:
-            # Save the file as-is
-            with open(filepath, "wb") as f:
-                f.write(audio_content)
-            print(f"Saved as-is: {filepath}")
-        
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
-        
-        # Update metadata CSV
-        with open(METADATA_FILE, "a", encoding="utf-8") as f:
-            f.write(f"{filepath}|{sentence}\n")
-        
-        # Update state
-        recorded = state.get("recorded", [])
-        if sentence not in recorded:
-            recorded.append(sentence)
-            state["recorded"] = recorded
-            save_state(state)
-        
-        # Optional: Upload to Google Drive
-        if drive_uploader:
-            try:
-                drive_uploader.upload_file(filepath, folder_name='Tigrigna Speech Dataset')
-                print(f"✅ Uploaded {filename} to Google Drive")
-            except Exception as e:
-                print(f"⚠️ Failed to upload {filename} to Google Drive: {e}")
-        
-        # Optional: Upload to Dropbox
-        if DROPBOX_ENABLED:
-            try:
-                dropbox_uploader.upload_file(filepath)
-                print(f"✅ Uploaded {filename} to Dropbox")
-                
-                # Also upload the updated metadata.csv
-                dropbox_uploader.upload_file(METADATA_FILE)
-                print(f"✅ Uploaded metadata.csv to Dropbox")
-                
-                # Also upload the updated sentence_state.json
-                dropbox_uploader.upload_file(STATE_FILE)
-                print(f"✅ Uploaded sentence_state.json to Dropbox")
-                
-                # Clean up local audio file after successful upload to save disk space
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    print(f"🗑️ Cleaned up local file: {filename}")
-            except Exception as e:
-                print(f"⚠️ Failed to upload to Dropbox: {e}")
-                # Don't delete the file if upload failed
-        
+            # Clean up temp file
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            
+            # Decode once: measure level, clipping, silence and noise floor, then trim silence,
+            # and reject bad clips before anything is uploaded
+            if analyze:
+                with SUBMIT_STAGE_SECONDS.time(stage="analysis"):
+                    quality, trimmed = await asyncio.to_thread(process_clip, wav_path)
+                TRIMMED_SECONDS.inc(trimmed)
+                problems = quality_checker.problems(quality) if quality else []
+                if problems:
+                    os.remove(wav_path)
+                    for reason, _ in problems:
+                        QUALITY_REJECTIONS.inc(reason=reason)
+                    raise HTTPException(
+                        status_code=422,
+                        detail=f"Recording rejected: {', '.join(message for _, message in problems)}. Please record again."
+                    )
+            
+            # Compress the accepted clip for storage and upload
+            if wav_path != filepath and os.path.exists(wav_path):
+                with SUBMIT_STAGE_SECONDS.time(stage="encode"):
+                    await transcoder.encode(wav_path, filepath)
+                os.remove(wav_path)
+        except TranscoderBusy:
+            TRANSCODE_FAILURES.inc(reason="busy")
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy processing other recordings. Please try again in a moment."
+            )
+        except TranscodeTimeout:
+            TRANSCODE_FAILURES.inc(reason="timeout")
+            raise HTTPException(status_code=504, detail="Audio conversion timed out.")
+        except TranscodeError as e:
+            TRANSCODE_FAILURES.inc(reason="decode_error")
+            print(f"⚠️ Could not decode upload: {e}")
+            raise HTTPException(status_code=400, detail="Could not decode the uploaded audio.")
+        
+        BYTES_OUT.inc(os.path.getsize(filepath), codec=codec)
+        
+        with SUBMIT_STAGE_SECONDS.time(stage="metadata"):
+            # Update metadata (with the sentence ID, so other workers don't have to look it up)
+            sentence_id = scheduler.store.resolve(sentence, sentence_id)
+            row_id = storage.append_recording(filepath, sentence, quality, codec, **upload, sentence_id=sentence_id)
+            
+            # Update state
+            storage.mark_recorded(sentence)
+            scheduler.mark_recorded(sentence, sentence_id)
+            metadata_index.add(filepath, sentence)
+            if shared_state:
+                shared_state.applied(row_id)
+        
+        # Queue cloud backups; the local clip is deleted once every upload is acknowledged
+        with SUBMIT_STAGE_SECONDS.time(stage="enqueue_uploads"):
+            outbox.enqueue(f"clip-{filename}", filepath, ["drive", "dropbox"], delete_after=DROPBOX_ENABLED)
+            snapshot_debouncer.note_change()
+        
+        stored = (filename, sentence)
+        SUBMISSIONS.inc(status="200")
+        SUBMIT_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
         return {
             "success": True,
             "filename": filename,
+            "codec": codec,
+            "quality": quality,
             "message": "Recording saved successfully!"
         }
     
+    except HTTPException as e:
+        SUBMISSIONS.inc(status=str(e.status_code))
+        # Clean up temp/intermediate files on error
+        for path in (temp_path, wav_path):
+            if path and path != filepath and os.path.exists(path):
+                os.unlink(path)
+        raise
     except Exception as e:
-        # Clean up temp file on error
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
+        SUBMISSIONS.inc(status="500")
+        # Clean up temp/intermediate files on error
+        for path in (temp_path, wav_path):
+            if path and path != filepath and os.path.exists(path):
+                os.unlink(path)
         raise HTTPException(status_code=500, detail=f"Error saving recording: {str(e)}")
+    finally:
+        if submission is not None:
+            # Retries waiting on this submission get its clip, or process their own copy if it failed
+            inflight_submissions.finish(submission_keys, submission, stored)
+
+# Clip bytes for /export: the local copy while it is still here, otherwise streamed from Dropbox
+def open_export_clip(filepath):
+    clip = dataset_export.open_local(filepath)
+    if clip is None and DROPBOX_ENABLED:
+        clip = dropbox_uploader.open_file(os.path.basename(filepath))
+    return clip
+
+# Rows whose clip can be exported: a local copy, or - once its upload went through - the file in
+# Dropbox (clips deleted there are dropped from the metadata by the reconciler)
+def available_export_rows(rows):
+    pending = outbox.pending_paths()
+    return [(filepath, sentence) for filepath, sentence in rows
+            if os.path.exists(filepath) or (DROPBOX_ENABLED and filepath not in pending)]
+
+def select_export_rows(authorization, speaker, since, until, sentence_ids, shard_size):
+    """Check the export token and return the recordings matching the filters"""
+    if not dataset_export.export_token():
+        raise HTTPException(status_code=403, detail="Export is disabled. Set EXPORT_TOKEN to enable it.")
+    if not dataset_export.authorized(authorization):
+        raise HTTPException(status_code=401, detail="Invalid export token.", headers={"WWW-Authenticate": "Bearer"})
+    if shard_size < 0:
+        raise HTTPException(status_code=400, detail="shard_size must not be negative.")
+    
+    try:
+        sentences = None
+        if sentence_ids:
+            scheduler.refresh()
+            ids = [int(i) for i in sentence_ids.split(",") if i.strip()]
+            unknown = [i for i in ids if not 0 <= i < scheduler.total]
+            if unknown:
+                raise ValueError(f"unknown sentence IDs {unknown}")
+            sentences = [scheduler.store.get(i) for i in ids]
+        export_filter = dataset_export.ExportFilter(
+            speakers=[name.strip() for name in speaker.split(",") if name.strip()] if speaker else None,
+            since=dataset_export.parse_time(since),
+            until=dataset_export.parse_time(until),
+            sentences=sentences,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid export filter: {e}")
+    return export_filter.select(storage.iter_recordings())
+
+@app.get("/export")
+async def export_dataset(
+    speaker: str = None,
+    since: str = None,
+    until: str = None,
+    sentence_ids: str = None,
+    shard_size: int = 0,
+    shard: int = 0,
+    authorization: str = Header(None)
+):
+    """Stream clips + per-clip JSON as a tar (or one WebDataset shard of shard_size clips)"""
+    if DROPBOX_ENABLED:
+        # Catch up with clips deleted from Dropbox since the last reconciliation (the changes
+        # since its cursor), so the metadata lists exactly the clips that are there
+        try:
+            await reconciler.reconcile()
+        except Exception as e:
+            print(f"⚠️ Export: Dropbox reconciliation failed ({e}) - clips deleted meanwhile are skipped")
+    rows = select_export_rows(authorization, speaker, since, until, sentence_ids, shard_size)
+    shards = dataset_export.split_shards(rows, shard_size)
+    if shard not in shards:
+        raise HTTPException(status_code=404, detail=f"Shard {shard} has no clips.")
+    # Counted before streaming, so X-Export-Clips leaves out clips that can't be fetched
+    rows = await asyncio.to_thread(available_export_rows, shards.get(shard, []))
+    clip_info = dict(storage.iter_quality())
+    
+    filename = f"dataset-{shard:06d}.tar" if shard_size else "dataset.tar"
+    return StreamingResponse(
+        # A plain generator: Starlette iterates it in a thread, so file/Dropbox reads don't block the loop
+        dataset_export.stream_archive(rows, open_export_clip, clip_info, include_csv=not shard_size),
+        media_type="application/x-tar",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Export-Clips": str(len(rows)),
+            "X-Export-Shards": str(len(shards)),
+        }
+    )
+
+@app.get("/export/manifest")
+async def export_manifest(
+    speaker: str = None,
+    since: str = None,
+    until: str = None,
+    sentence_ids: str = None,
+    shard_size: int = 0,
+    authorization: str = Header(None)
+):
+    """Shards /export would produce for these filters (to download them in parallel or resume)"""
+    rows = select_export_rows(authorization, speaker, since, until, sentence_ids, shard_size)
+    shards = []
+    for index, shard_rows in (dataset_export.split_shards(rows, shard_size).items() if rows else []):
+        shards.append({
+            "shard": index,
+            "clips": len(shard_rows),
+            "first": os.path.basename(shard_rows[0][0]),
+            "last": os.path.basename(shard_rows[-1][0]),
+        })
+    return {"clips": len(rows), "shard_size": shard_size, "shards": shards}
 
 @app.post("/reset")
 async def reset_progress():
     """Reset all progress (for testing)"""
     try:
         # Reset state
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump({"recorded": []}, f, ensure_ascii=False)
+        save_state({"recorded": []})
+        scheduler.reload()
         
         return {"success": True, "message": "Progress reset successfully"}
     
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Turn stored clips (FLAC/Opus, see CLIP_CODEC in transcoder.py) back into
+canonical PCM WAV for training pipelines that need it.
+
+Clips are decoded in parallel (one ffmpeg process per clip). Existing WAV
+files that are newer than their source are skipped, so re-running after a
+new download only converts the new clips. WAV clips are linked (or copied)
+as they are.
+
+Usage:
+    python3 materialize_wav.py clips wav_clips                           # decode a folder
+    python3 materialize_wav.py clips wav_clips --metadata metadata.csv   # + wav_clips/metadata.csv
+"""
+
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_format import sniff_audio_format
+from storage import FileStorage, METADATA_HEADER
+from transcoder import CLIP_CODECS, Transcoder, TranscodeError, TranscodeTimeout, ffmpeg_available, transcode
+
+CLIP_EXTENSIONS = tuple(extension for extension, _, _ in CLIP_CODECS.values())
+
+
+def wav_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0] + ".wav"
+
+
+def materialize(src_path, dst_path, transcoder):
+    """Write the canonical WAV for one clip; returns "converted", "linked" or "skipped" """
+    if os.path.exists(dst_path) and os.path.getmtime(dst_path) >= os.path.getmtime(src_path):
+        return "skipped"
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp.wav"
+    if src_path.endswith(".wav"):
+        try:
+            os.link(src_path, tmp_path)
+        except OSError:
+            shutil.copy2(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+        return "linked"
+    try:
+        transcode(src_path, tmp_path, sniff_audio_format(src_path), transcoder.sample_rate, transcoder.channels,
+                  timeout=transcoder.timeout)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, dst_path)
+    return "converted"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode stored FLAC/Opus clips to canonical WAV")
+    parser.add_argument("clips", help="folder with the stored clips (e.g. a Dropbox download)")
+    parser.add_argument("output", help="folder for the WAV files")
+    parser.add_argument("--metadata", help="metadata.csv to rewrite with the WAV paths into the output folder")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel ffmpeg processes")
+    args = parser.parse_args()
+
+    if not ffmpeg_available():
+        print("❌ ffmpeg is required to decode clips")
+        return 1
+
+    transcoder = Transcoder.from_env()
+    os.makedirs(args.output, exist_ok=True)
+    sources = sorted(name for name in os.listdir(args.clips) if name.endswith(CLIP_EXTENSIONS))
+
+    def run(name):
+        try:
+            return materialize(os.path.join(args.clips, name), os.path.join(args.output, wav_name(name)), transcoder)
+        except (TranscodeError, TranscodeTimeout) as e:
+            print(f"⚠️ Could not decode {name}: {e}")
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(run, sources))
+    counts = {result: results.count(result) for result in set(results)}
+    print(f"✅ {len(sources)} clips: {counts.get('converted', 0)} converted, {counts.get('linked', 0)} linked, "
+          f"{counts.get('skipped', 0)} up to date, {counts.get('failed', 0)} failed")
+
+    if args.metadata:
+        metadata_file = os.path.join(args.output, "metadata.csv")
+        files = FileStorage(os.devnull, args.metadata)
+        with open(metadata_file, "w", encoding="utf-8") as f:
+            f.write(METADATA_HEADER)
+            f.writelines(
+                f"{os.path.join(args.output, wav_name(filepath))}|{sentence}\n"
+                for filepath, sentence in files.iter_recordings()
+            )
+        print(f"✅ Wrote {metadata_file}")
+
+    return 1 if counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+In-memory index over the recordings metadata.
+Loaded once at startup and updated incrementally on every new recording
+(and every clip removed after it was deleted from Dropbox), so stats endpoints never have to rescan metadata.csv / the database.
+"""
+
+import os
+import threading
+
+
+def parse_speaker(filename):
+    """Extract the speaker name from a clip filename (format: speaker_num_timestamp_id.ext).
+    Returns None for clips recorded without a speaker name."""
+    parts = os.path.basename(filename).split('_')
+    if len(parts) < 4:
+        return None
+    return '_'.join(parts[:-3]) or None
+
+
+def clip_number(filename):
+    """Clip number from a clip filename (speaker_num_timestamp_id.ext), or None"""
+    parts = os.path.splitext(os.path.basename(filename))[0].split('_')
+    if len(parts) < 3:
+        return None
+    try:
+        return int(parts[-3])
+    except ValueError:
+        return None
+
+
+class MetadataIndex:
+    def __init__(self):
+        """Create an empty index"""
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.sentences = {}  # sentence -> number of recordings
+        self.speakers = {}  # speaker -> list of (filename, sentence)
+        self.max_clip_number = 0
+
+    def _add(self, filepath, sentence):
+        filename = os.path.basename(filepath)
+        self.total += 1
+        self.sentences[sentence] = self.sentences.get(sentence, 0) + 1
+        self.max_clip_number = max(self.max_clip_number, clip_number(filename) or 0)
+        speaker = parse_speaker(filename)
+        if speaker:
+            self.speakers.setdefault(speaker, []).append((filename, sentence))
+
+    def load(self, rows):
+        """(Re)build the index from (filepath, sentence) rows"""
+        with self._lock:
+            self._reset()
+            try:
+                for filepath, sentence in rows:
+                    self._add(filepath, sentence)
+                print(f"📇 Metadata index loaded: {self.total} recordings, {len(self.speakers)} speakers")
+            except Exception as e:
+                print(f"⚠️ Error loading metadata index: {e}")
+
+    def add(self, filepath, sentence):
+        """Record a row that was just appended to the metadata"""
+        with self._lock:
+            self._add(filepath, sentence)
+
+    def remove(self, filepath, sentence):
+        """Forget a row that was removed from the metadata; returns True if its sentence has
+        no recording left"""
+        filename = os.path.basename(filepath)
+        with self._lock:
+            self.total -= 1
+            remaining = self.sentences.get(sentence, 1) - 1
+            if remaining > 0:
+                self.sentences[sentence] = remaining
+            else:
+                self.sentences.pop(sentence, None)
+            speaker = parse_speaker(filename)
+            recordings = self.speakers.get(speaker)
+            if recordings and (filename, sentence) in recordings:
+                recordings.remove((filename, sentence))
+                if not recordings:
+                    del self.speakers[speaker]
+            return remaining <= 0
+
+    def total_recordings(self):
+        return self.total
+
+    def highest_clip_number(self):
+        """Largest clip number in the metadata (0 if none) - new clips must be numbered above it"""
+        return self.max_clip_number
+
+    def unique_sentences(self):
+        with self._lock:
+            return set(self.sentences)
+
+    def speaker_recordings(self, speaker):
+        """List of (filename, sentence) recorded by one speaker"""
+        with self._lock:
+            return list(self.speakers.get(speaker, []))
+
+    def speaker_counts(self):
+        """Mapping of speaker name -> number of recordings"""
+        with self._lock:
+            return {name: len(recordings) for name, recordings in self.speakers.items()}
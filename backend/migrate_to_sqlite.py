@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+One-shot migration of metadata.csv + sentence_state.json into the SQLite store.
+Run it once from the backend folder, then start the server with STORAGE_BACKEND=sqlite.
+
+Usage:
+    python3 migrate_to_sqlite.py                 # import files into recordings.db
+    python3 migrate_to_sqlite.py --export        # write recordings.db back out as CSV/JSON
+"""
+
+import argparse
+import os
+import sys
+
+from storage import SQLiteStorage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate recordings metadata to/from SQLite")
+    parser.add_argument("--db", default=os.getenv('STORAGE_DB_FILE', 'recordings.db'), help="SQLite database file")
+    parser.add_argument("--state", default="sentence_state.json", help="sentence_state.json path")
+    parser.add_argument("--metadata", default="metadata.csv", help="metadata.csv path")
+    parser.add_argument("--export", action="store_true", help="Export the database to the CSV/JSON files instead")
+    parser.add_argument("--force", action="store_true", help="Import even if the database already has data")
+    args = parser.parse_args()
+
+    store = SQLiteStorage(args.db, args.state, args.metadata)
+
+    if args.export:
+        state_file, metadata_file = store.export_files()
+        print(f"✅ Exported {args.db} to {metadata_file} and {state_file}")
+        return 0
+
+    if not os.path.exists(args.metadata) and not os.path.exists(args.state):
+        print(f"❌ Nothing to import: {args.metadata} and {args.state} not found")
+        return 1
+
+    if not store.is_empty() and not args.force:
+        print(f"⚠️ {args.db} already contains data - use --force to import anyway")
+        return 1
+
+    rows, sentences = store.import_files()
+    print(f"✅ Imported {rows} recordings and {sentences} recorded sentences into {args.db}")
+    print("💡 Start the server with STORAGE_BACKEND=sqlite to use it")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
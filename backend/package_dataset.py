@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Pack the recorded clips into size-bounded Parquet (or Arrow IPC) shards for
+training, so jobs read a few large files instead of one small file per clip.
+
+Each row holds the audio bytes as stored (FLAC/Opus/WAV) in an
+audio {bytes, path} struct (the layout Hugging Face `datasets` reads as an
+Audio feature) plus filename, sentence, speaker, recording time, codec,
+duration, sample rate and the SHA-256 of the audio bytes.
+
+Clips are grouped into shards of about --max-shard-mb; every shard is
+written by one worker process, which reads its clips (local, or pulled from
+Dropbox with --dropbox), decodes them once with ffmpeg to validate them and
+measure their duration, and streams rows into the shard in row groups.
+Clips that fail to decode are left out and listed in the manifest.
+
+manifest.json in the output folder records the shards and the clips in
+each; with --incremental only clips that are not in it yet are packed (into
+new shards), so a nightly run only handles the day's recordings.
+
+Usage:
+    python3 package_dataset.py dataset/                            # pack metadata.csv + clips/
+    python3 package_dataset.py dataset/ --incremental --dropbox    # new clips only, missing ones from Dropbox
+    python3 package_dataset.py dataset/ --format arrow --max-shard-mb 256 --workers 8
+
+Needs pyarrow (pip install pyarrow); ffmpeg for duration/validation of FLAC/Opus clips.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from dataset_export import clip_timestamp
+from metadata_index import parse_speaker
+from storage import FileStorage
+from transcoder import FFMPEG, ffmpeg_available
+
+MANIFEST = "manifest.json"
+# Rows are flushed to the shard in row groups of about this many audio bytes
+ROW_GROUP_BYTES = 32 * 1024 * 1024
+# Size assumed for clips that are not available locally (only used to plan shards)
+DEFAULT_CLIP_BYTES = 64 * 1024
+DECODE_SAMPLE_RATE = 16000
+
+CODECS = {".flac": "flac", ".opus": "opus", ".wav": "wav"}
+
+
+def schema():
+    return pa.schema([
+        ("audio", pa.struct([("bytes", pa.binary()), ("path", pa.string())])),
+        ("filename", pa.string()),
+        ("sentence", pa.string()),
+        ("speaker", pa.string()),
+        ("recorded_at", pa.int64()),
+        ("codec", pa.string()),
+        ("duration", pa.float64()),
+        ("sample_rate", pa.int32()),
+        ("sha256", pa.string()),
+    ])
+
+
+# Per-worker Dropbox connection, created on first use
+_dropbox = None
+
+
+def fetch_clip(filepath, clips_dir, use_dropbox):
+    """Audio bytes of a clip from clips_dir (or Dropbox), or None if unavailable"""
+    global _dropbox
+    local_path = os.path.join(clips_dir, os.path.basename(filepath))
+    if os.path.exists(local_path):
+        with open(local_path, "rb") as f:
+            return f.read()
+    if not use_dropbox:
+        return None
+    if _dropbox is None:
+        from dropbox_helper import DropboxUploader
+        _dropbox = DropboxUploader()
+    clip = _dropbox.open_file(os.path.basename(filepath))
+    return b"".join(clip[1]) if clip else None
+
+
+def probe(data, filename):
+    """(duration seconds, sample rate) after decoding the clip; raises ValueError if it doesn't decode"""
+    if ffmpeg_available():
+        result = subprocess.run(
+            [FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+             "-ac", "1", "-ar", str(DECODE_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+            input=data, capture_output=True, timeout=60,
+        )
+        if result.returncode != 0 or not result.stdout:
+            raise ValueError(result.stderr.decode("utf-8", "replace").strip() or "no audio")
+        sample_rate = None
+        if data.startswith(b"fLaC"):
+            # STREAMINFO: 20-bit sample rate after the 10 bytes of block sizes
+            sample_rate = int.from_bytes(data[18:21], "big") >> 4
+        elif data[:4] == b"RIFF":
+            sample_rate = int.from_bytes(data[24:28], "little")
+        elif data.startswith(b"OggS"):
+            sample_rate = 48000  # Opus always decodes at 48 kHz
+        return len(result.stdout) / 2 / DECODE_SAMPLE_RATE, sample_rate
+    if not filename.endswith(".wav"):
+        raise ValueError("ffmpeg is needed to decode compressed clips")
+    try:
+        with wave.open(io.BytesIO(data), "rb") as w:
+            return w.getnframes() / w.getframerate(), w.getframerate()
+    except (wave.Error, EOFError) as e:
+        raise ValueError(str(e))
+
+
+class ShardWriter:
+    """Writes rows to a Parquet or Arrow IPC file in row groups"""
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.tmp_path = f"{path}.tmp"
+        if file_format == "parquet":
+            self._writer = pq.ParquetWriter(self.tmp_path, schema(), compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(self.tmp_path, schema())
+        self._rows = []
+        self._buffered = 0
+
+    def add(self, row):
+        self._rows.append(row)
+        self._buffered += len(row["audio"]["bytes"])
+        if self._buffered >= ROW_GROUP_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            table = pa.Table.from_pylist(self._rows, schema=schema())
+            if self.file_format == "parquet":
+                self._writer.write_table(table)
+            else:
+                for batch in table.to_batches():
+                    self._writer.write_batch(batch)
+        self._rows = []
+        self._buffered = 0
+
+    def close(self):
+        """Finish the file and move it into place (a crashed run leaves no half-written shard)"""
+        self.flush()
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self.tmp_path)
+
+
+def pack_shard(path, rows, clips_dir, file_format, use_dropbox):
+    """Read, validate and write one shard (runs in a worker process).
+    Returns a manifest entry plus the clips that had to be left out."""
+    writer = ShardWriter(path, file_format)
+    packed, failed, audio_bytes = [], [], 0
+    try:
+        for filepath, sentence in rows:
+            filename = os.path.basename(filepath)
+            data = fetch_clip(filepath, clips_dir, use_dropbox)
+            if data is None:
+                failed.append({"filename": filename, "error": "clip not found"})
+                continue
+            try:
+                duration, sample_rate = probe(data, filename)
+            except (ValueError, subprocess.TimeoutExpired) as e:
+                failed.append({"filename": filename, "error": str(e) or "decode timed out"})
+                continue
+            writer.add({
+                "audio": {"bytes": data, "path": filename},
+                "filename": filename,
+                "sentence": sentence,
+                "speaker": parse_speaker(filename),
+                "recorded_at": clip_timestamp(filename),
+                "codec": CODECS.get(os.path.splitext(filename)[1]),
+                "duration": round(duration, 3),
+                "sample_rate": sample_rate,
+                "sha256": hashlib.sha256(data).hexdigest(),
+            })
+            packed.append(filename)
+            audio_bytes += len(data)
+    except BaseException:
+        writer.abort()
+        raise
+    if packed:
+        writer.close()
+    else:
+        writer.abort()
+    return {
+        "file": os.path.basename(path) if packed else None,
+        "clips": packed,
+        "audio_bytes": audio_bytes,
+        "bytes": os.path.getsize(path) if packed else 0,
+    }, failed
+
+
+def plan_shards(rows, clips_dir, max_shard_bytes):
+    """Split rows into consecutive groups of about max_shard_bytes of audio"""
+    shards, current, current_bytes = [], [], 0
+    for row in rows:
+        local_path = os.path.join(clips_dir, os.path.basename(row[0]))
+        size = os.path.getsize(local_path) if os.path.exists(local_path) else DEFAULT_CLIP_BYTES
+        if current and current_bytes + size > max_shard_bytes:
+            shards.append(current)
+            current, current_bytes = [], 0
+        current.append(row)
+        current_bytes += size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"runs": 0, "shards": [], "failed": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack clips + metadata into Parquet/Arrow shards")
+    parser.add_argument("output", help="folder for the shards and manifest.json")
+    parser.add_argument("--metadata", default="metadata.csv", help="metadata.csv path")
+    parser.add_argument("--clips", default="clips", help="folder with the clips")
+    parser.add_argument("--dropbox", action="store_true", help="pull clips missing locally from Dropbox")
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet", help="shard file format")
+    parser.add_argument("--max-shard-mb", type=float, default=512, help="audio per shard")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--incremental", action="store_true", help="only pack clips not in manifest.json yet")
+    args = parser.parse_args()
+
+    if pa is None:
+        print("❌ pyarrow is required: pip install pyarrow")
+        return 1
+    if not os.path.exists(args.metadata):
+        print(f"❌ {args.metadata} not found")
+        return 1
+    if not ffmpeg_available():
+        print("⚠️ ffmpeg not available - only WAV clips can be validated")
+
+    os.makedirs(args.output, exist_ok=True)
+    manifest_path = os.path.join(args.output, MANIFEST)
+    if args.incremental:
+        manifest = load_manifest(manifest_path)
+    else:
+        # Full rebuild: drop the shards of previous runs
+        for shard in load_manifest(manifest_path)["shards"]:
+            if os.path.exists(os.path.join(args.output, shard["file"])):
+                os.remove(os.path.join(args.output, shard["file"]))
+        manifest = {"runs": 0, "shards": [], "failed": []}
+
+    packed = {filename for shard in manifest["shards"] for filename in shard["clips"]}
+    rows = [
+        (filepath, sentence)
+        for filepath, sentence in FileStorage(os.devnull, args.metadata).iter_recordings()
+        if os.path.basename(filepath) not in packed
+    ]
+    if not rows:
+        print("✅ Nothing new to pack")
+        return 0
+
+    run = manifest["runs"]
+    manifest["runs"] = run + 1
+    manifest["format"] = args.format
+    extension = "parquet" if args.format == "parquet" else "arrow"
+    shards = plan_shards(rows, args.clips, int(args.max_shard_mb * 1024 * 1024))
+    print(f"📦 Packing {len(rows)} clips into {len(shards)} {args.format} shards with {args.workers} workers")
+
+    started = time.monotonic()
+    failed = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [
+            pool.submit(
+                pack_shard, os.path.join(args.output, f"shard-{run:03d}-{index:05d}.{extension}"),
+                shard_rows, args.clips, args.format, args.dropbox
+            )
+            for index, shard_rows in enumerate(shards)
+        ]
+        for future in as_completed(futures):
+            entry, shard_failed = future.result()
+            failed.extend(shard_failed)
+            if entry["file"]:
+                manifest["shards"].append(entry)
+                # Saved after every shard so an interrupted run resumes with --incremental
+                save_manifest(manifest_path, manifest)
+                print(f"✅ {entry['file']}: {len(entry['clips'])} clips, {entry['bytes'] / 2**20:.1f} MB")
+
+    manifest["shards"].sort(key=lambda shard: shard["file"])
+    manifest["failed"] = failed
+    save_manifest(manifest_path, manifest)
+
+    packed_count = sum(len(shard["clips"]) for shard in manifest["shards"]) - len(packed)
+    print(f"✅ Packed {packed_count} clips in {time.monotonic() - started:.1f}s "
+          f"({len(failed)} skipped, see {manifest_path})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Readiness gate for the startup warm-up.
+
+The server accepts connections immediately while state is restored from
+Dropbox in the background (see warm_up in main.py), so cold starts don't
+turn into a stretch of 502s from the proxy. Until the warm-up finishes
+/health reports "warming" and requests that need the restored state are
+answered with 503 + Retry-After.
+"""
+
+import asyncio
+import json
+import time
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.started_at = time.monotonic()
+        self.warmup_seconds = None
+        self._event = asyncio.Event()
+
+    def set_ready(self):
+        self.warmup_seconds = round(time.monotonic() - self.started_at, 2)
+        self.ready = True
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+
+
+class ReadinessMiddleware:
+    """Answers 503 while warming up, except for paths that work without the restored state"""
+
+    def __init__(self, app, readiness, allow_paths=(), retry_after=2):
+        self.app = app
+        self.readiness = readiness
+        self.allow_paths = set(allow_paths)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.readiness.ready or scope["path"] in self.allow_paths:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "Server is starting up. Please try again in a moment."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
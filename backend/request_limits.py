@@ -0,0 +1,145 @@
+"""
+Upload size limits and streaming helpers for recording submissions.
+
+MaxBodySizeMiddleware rejects oversized request bodies with 413 while they are
+still arriving (or straight away from Content-Length). MultipartUpload parses
+the multipart/form-data body as it comes off the socket and writes the file
+part straight to the staging file, so the upload is written to disk once
+(no spooled copy first) and memory use stays constant no matter how long the
+clip is.
+"""
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Text fields (sentence, speaker, ...) are kept in memory, so they are capped
+MAX_FIELD_BYTES = 64 * 1024
+
+
+def _too_large(max_bytes):
+    return HTTPException(
+        status_code=413,
+        detail=f"Recording is too large. Maximum upload size is {max_bytes / (1024 * 1024):.1f} MB."
+    )
+
+
+class MaxBodySizeMiddleware:
+    def __init__(self, app, max_body_size, paths=None):
+        """Limit request bodies to max_body_size bytes (only for the given paths, if set)"""
+        self.app = app
+        self.max_body_size = max_body_size
+        self.paths = set(paths) if paths else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (self.paths and scope["path"] not in self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        # Reject immediately if the client announces an oversized body
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            error = _too_large(self.max_body_size)
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # Raised inside body parsing, so FastAPI turns it into a 413 response
+                    raise _too_large(self.max_body_size)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class MultipartUpload:
+    """One multipart/form-data request body: the file_field part is written to file_obj (updating
+    digest, e.g. hashlib.sha256(), on the way), the other fields are collected as strings"""
+
+    def __init__(self, file_field, file_obj, max_bytes, digest=None):
+        self.file_field = file_field
+        self.file_obj = file_obj
+        self.max_bytes = max_bytes
+        self.digest = digest
+        self.fields = {}
+        self.size = 0
+        self.has_file = False
+        self._header_name = self._header_value = self._disposition = b""
+        self._name = None
+        self._is_file = False
+        self._data = bytearray()
+
+    def _on_part_begin(self):
+        self._disposition = b""
+        self._name = None
+        self._is_file = False
+        self._data = bytearray()
+
+    def _on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._is_file = self._name == self.file_field and not self.has_file
+        self.has_file = self.has_file or self._is_file
+
+    def _on_part_data(self, data, start, end):
+        chunk = data[start:end]
+        if not self._is_file:
+            self._data += chunk
+            if len(self._data) > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Form field {self._name!r} is too large.")
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        if self.digest is not None:
+            self.digest.update(chunk)
+        self.file_obj.write(chunk)
+
+    def _on_part_end(self):
+        if not self._is_file and self._name:
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+
+    async def parse(self, request):
+        """Consume the request body; returns the number of file bytes written"""
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload.")
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+            parser.finalize()
+        except ValueError as e:  # python-multipart's parse errors
+            raise HTTPException(status_code=400, detail=f"Malformed multipart upload: {e}")
+        return self.size
@@ -0,0 +1,166 @@
+"""
+Sentence leases.
+
+/next_sentence reserves the sentence it hands out for a limited time so other
+speakers don't get the same one; submit_recording consumes the lease and
+expired leases go back into the pool.
+
+The scheduler only talks to a lease store through try_acquire / release_holder
+/ consume / pop_expired / active / count. InMemoryLeaseStore serves a single
+process; SQLiteLeaseStore keeps leases in the shared database so several
+workers never hand out the same sentence (see shared_state.py).
+"""
+
+import heapq
+import sqlite3
+import threading
+import time
+
+
+class InMemoryLeaseStore:
+    def __init__(self):
+        self._leases = {}  # sentence ID -> (holder, expires_at)
+        self._by_holder = {}  # holder -> sentence ID
+        self._expiry_heap = []  # (expires_at, sentence ID), may hold stale entries
+        self._lock = threading.Lock()
+
+    def try_acquire(self, sentence, holder, expires_at):
+        """Lease a sentence to holder (None for anonymous); False if someone else holds it"""
+        with self._lock:
+            current = self._leases.get(sentence)
+            if current and current[1] > time.time() and current[0] != holder:
+                return False
+            self._leases[sentence] = (holder, expires_at)
+            if holder:
+                self._by_holder[holder] = sentence
+            heapq.heappush(self._expiry_heap, (expires_at, sentence))
+            return True
+
+    def _drop(self, sentence):
+        holder, _ = self._leases.pop(sentence)
+        if holder and self._by_holder.get(holder) == sentence:
+            del self._by_holder[holder]
+
+    def release_holder(self, holder):
+        """Release the lease held by holder; returns the sentence it held (or None)"""
+        with self._lock:
+            sentence = self._by_holder.get(holder)
+            if sentence is not None:
+                self._drop(sentence)
+            return sentence
+
+    def consume(self, sentence):
+        """The sentence was recorded - its lease is no longer needed"""
+        with self._lock:
+            if sentence in self._leases:
+                self._drop(sentence)
+
+    def pop_expired(self, now=None):
+        """Remove and return the sentences whose lease has expired"""
+        now = now or time.time()
+        expired = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, sentence = heapq.heappop(self._expiry_heap)
+                current = self._leases.get(sentence)
+                # Skip heap entries for leases that were renewed, released or consumed
+                if current and current[1] == expires_at:
+                    self._drop(sentence)
+                    expired.append(sentence)
+        return expired
+
+    def active(self):
+        """Sentences currently leased"""
+        with self._lock:
+            return list(self._leases)
+
+    def count(self):
+        return len(self._leases)
+
+
+class SQLiteLeaseStore:
+    """Leases in a table of the shared SQLite database.
+
+    Every worker keeps its own pool, so an expired lease has to reach all of
+    them: pop_expired returns the leases that expired since this worker last
+    asked and leaves the rows in place (they are overwritten by the next
+    try_acquire and purged after purge_after seconds).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sentence_leases (
+            sentence_id INTEGER PRIMARY KEY,
+            holder TEXT,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sentence_leases_holder ON sentence_leases(holder);
+        CREATE INDEX IF NOT EXISTS idx_sentence_leases_expires ON sentence_leases(expires_at);
+    """
+
+    def __init__(self, db_file, purge_after=3600.0):
+        self.purge_after = purge_after
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._expired_until = time.time()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def try_acquire(self, sentence, holder, expires_at):
+        """Lease a sentence to holder (None for anonymous); False if someone else holds it"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT holder, expires_at FROM sentence_leases WHERE sentence_id = ?", (sentence,)
+                ).fetchone()
+                if row and row[1] > now and row[0] != holder:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                if holder:
+                    # One lease per holder
+                    self._conn.execute("DELETE FROM sentence_leases WHERE holder = ?", (holder,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sentence_leases (sentence_id, holder, expires_at) VALUES (?, ?, ?)",
+                    (sentence, holder, expires_at)
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return True
+
+    def release_holder(self, holder):
+        """Release the lease held by holder; returns the sentence it held (or None)"""
+        rows = self._execute(
+            "DELETE FROM sentence_leases WHERE holder = ? AND expires_at > ? RETURNING sentence_id",
+            (holder, time.time())
+        )
+        return rows[0][0] if rows else None
+
+    def consume(self, sentence):
+        """The sentence was recorded - its lease is no longer needed"""
+        self._execute("DELETE FROM sentence_leases WHERE sentence_id = ?", (sentence,))
+
+    def pop_expired(self, now=None):
+        """Sentences whose lease expired since the previous call (by this worker)"""
+        now = now or time.time()
+        since, self._expired_until = self._expired_until, now
+        expired = self._execute(
+            "SELECT sentence_id FROM sentence_leases WHERE expires_at > ? AND expires_at <= ?", (since, now)
+        )
+        self._execute("DELETE FROM sentence_leases WHERE expires_at <= ?", (now - self.purge_after,))
+        return [sentence for (sentence,) in expired]
+
+    def active(self):
+        """Sentences currently leased"""
+        rows = self._execute("SELECT sentence_id FROM sentence_leases WHERE expires_at > ?", (time.time(),))
+        return [sentence for (sentence,) in rows]
+
+    def count(self):
+        return self._execute("SELECT COUNT(*) FROM sentence_leases WHERE expires_at > ?", (time.time(),))[0][0]
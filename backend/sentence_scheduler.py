@@ -0,0 +1,157 @@
+"""
+Next-sentence scheduler.
+
+Keeps the pool of unrecorded sentence IDs (see sentence_store.py) as a
+swap-remove array plus a position array indexed by ID, so picking a random
+sentence and removing a recorded one are both O(1) and cost 16 bytes per
+sentence instead of a Python string each. The pool is only rebuilt when
+sentences.txt changes.
+
+Handed-out sentences are leased (see sentence_leases.py): they leave the pool
+until they are recorded or the lease expires, so concurrent speakers don't
+get the same sentence. With several workers each one has its own pool and
+the shared lease store decides who gets a sentence.
+"""
+
+import random
+import time
+from array import array
+
+from sentence_leases import InMemoryLeaseStore
+from sentence_store import SentenceStore
+
+# How many picks to try when the lease store reports sentences leased elsewhere
+LEASE_ATTEMPTS = 8
+
+
+class SentenceScheduler:
+    def __init__(self, sentences_file, load_recorded, lease_store=None, lease_ttl=300.0):
+        """load_recorded() returns the recorded sentences; it is only called on (re)load"""
+        self.store = SentenceStore(sentences_file)
+        self.load_recorded = load_recorded
+        self.leases = lease_store or InMemoryLeaseStore()
+        self.lease_ttl = lease_ttl
+        self._pool = array("Q")
+        self._positions = array("q")  # sentence ID -> index in _pool, -1 if not in it
+        self._loaded = False
+
+    @property
+    def total(self):
+        return len(self.store)
+
+    def _load(self):
+        total = len(self.store)
+        recorded = self.store.ids_matching(self.load_recorded())
+        self._positions = array("q", [0]) * total
+        for sentence_id in recorded:
+            self._positions[sentence_id] = -1
+        self._pool = array("Q", (i for i in range(total) if self._positions[i] == 0))
+        for position, sentence_id in enumerate(self._pool):
+            self._positions[sentence_id] = position
+        for sentence_id in self.leases.active():
+            self._remove(sentence_id)
+        print(f"📚 Loaded {total} sentences, {len(self._pool)} unrecorded")
+
+    def refresh(self):
+        """Reload if sentences.txt changed since the last load"""
+        if self.store.refresh() or not self._loaded:
+            self._loaded = True
+            self._load()
+
+    def reload(self):
+        """Force a reload (e.g. after the recorded state was reset or synced)"""
+        self._loaded = False
+        self.refresh()
+
+    @property
+    def remaining(self):
+        """Unrecorded sentences, including those currently leased"""
+        # With a shared lease store, sentences leased by other workers are still in our pool
+        leased = sum(
+            1 for sentence_id in self.leases.active()
+            if sentence_id < len(self._positions) and self._positions[sentence_id] == -1
+        )
+        return len(self._pool) + leased
+
+    @property
+    def available(self):
+        """Unrecorded sentences that are free to hand out"""
+        return len(self._pool)
+
+    def pick(self):
+        """Random sentence ID from the pool, or None when it is empty"""
+        if not self._pool:
+            return None
+        return self._pool[random.randrange(len(self._pool))]
+
+    def _add(self, sentence_id):
+        if sentence_id >= len(self._positions) or self._positions[sentence_id] != -1:
+            return
+        self._positions[sentence_id] = len(self._pool)
+        self._pool.append(sentence_id)
+
+    def _remove(self, sentence_id):
+        """Swap the sentence with the last element, then pop"""
+        if sentence_id >= len(self._positions):
+            return
+        position = self._positions[sentence_id]
+        if position == -1:
+            return
+        self._positions[sentence_id] = -1
+        last = self._pool.pop()
+        if position < len(self._pool):
+            self._pool[position] = last
+            self._positions[last] = position
+
+    def expire_leases(self):
+        """Return sentences with expired leases to the pool"""
+        for sentence_id in self.leases.pop_expired():
+            self._add(sentence_id)
+
+    def _lease_from_pool(self, holder):
+        expires_at = time.time() + self.lease_ttl
+        for _ in range(LEASE_ATTEMPTS):
+            sentence_id = self.pick()
+            if sentence_id is None:
+                return None
+            if self.leases.try_acquire(sentence_id, holder, expires_at):
+                self._remove(sentence_id)
+                return sentence_id
+        return None
+
+    def lease(self, holder=None):
+        """Reserve a random unrecorded sentence for holder (a client token or speaker name).
+        A holder has one lease at a time: asking again (e.g. skip, page reload) releases the previous
+        one. Without a holder the sentence is only picked, not leased, since nobody could ever
+        release it early. Returns (sentence_id, sentence), or None if nothing is free right now."""
+        self.expire_leases()
+        if not holder:
+            sentence_id = self.pick()
+            return None if sentence_id is None else (sentence_id, self.store.get(sentence_id))
+        released = self.leases.release_holder(holder)
+        sentence_id = self._lease_from_pool(holder)
+        if released is not None:
+            # Back in the pool only after picking, so a skip never returns the same sentence
+            self._add(released)
+            if sentence_id is None:
+                sentence_id = self._lease_from_pool(holder)
+        if sentence_id is None:
+            return None
+        return sentence_id, self.store.get(sentence_id)
+
+    def mark_recorded(self, sentence, sentence_id=None):
+        """Consume the sentence's lease and drop it from the pool.
+        sentence_id (as returned by lease) saves a scan of the corpus when it matches."""
+        sentence_id = self.store.resolve(sentence, sentence_id)
+        if sentence_id is None:
+            return None
+        self.leases.consume(sentence_id)
+        self._remove(sentence_id)
+        return sentence_id
+
+    def unmark_recorded(self, sentence, sentence_id=None):
+        """Put a sentence back into the pool after its last recording was removed"""
+        sentence_id = self.store.resolve(sentence, sentence_id)
+        if sentence_id is not None:
+            self._add(sentence_id)
+        return sentence_id
@@ -0,0 +1,139 @@
+"""
+Memory-mapped sentence corpus.
+
+sentences.txt is mmapped and indexed by a compact array of line start
+offsets (8 bytes per sentence). The index is persisted beside the file
+(sentences.txt.idx) and only rebuilt when the file's size or mtime changes.
+Every non-empty line gets a stable integer ID (its position among non-empty
+lines, so IDs stay stable as long as the file is only appended to), and only
+the lines actually served are decoded.
+"""
+
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+
+INDEX_MAGIC = b"SIDX1\0\0\0"
+INDEX_HEADER = struct.Struct("<8sQQQ")  # magic, file size, mtime_ns, line count
+
+
+class SentenceStore:
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or f"{path}.idx"
+        self.offsets = array("Q")
+        self._mm = None
+        self._file = None
+        self._signature = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._mm = None
+        self._file = None
+        self.offsets = array("Q")
+
+    def refresh(self):
+        """Re-map the file and load/rebuild the index if it changed; returns True if it did"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return False
+
+        self._close()
+        self._signature = signature
+        if signature is None or signature[0] == 0:
+            return True
+
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self._load_index(signature):
+            self._build_index()
+            self._save_index(signature)
+        return True
+
+    def _load_index(self, signature):
+        try:
+            with open(self.index_path, "rb") as f:
+                magic, size, mtime_ns, count = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or (size, mtime_ns) != signature:
+                    return False
+                offsets = array("Q")
+                offsets.frombytes(f.read(count * offsets.itemsize))
+                if len(offsets) != count:
+                    return False
+                self.offsets = offsets
+                return True
+        except (OSError, struct.error):
+            return False
+
+    def _build_index(self):
+        mm = self._mm
+        size = len(mm)
+        offsets = array("Q")
+        start = 0
+        while start < size:
+            end = mm.find(b"\n", start)
+            if end == -1:
+                end = size
+            if mm[start:end].strip():
+                offsets.append(start)
+            start = end + 1
+        self.offsets = offsets
+        print(f"🗂️ Built sentence index: {len(offsets)} sentences")
+
+    def _save_index(self, signature):
+        try:
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, signature[0], signature[1], len(self.offsets)))
+                self.offsets.tofile(f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"⚠️ Could not save sentence index: {e}")
+
+    def _line_bytes(self, sentence_id):
+        start = self.offsets[sentence_id]
+        end = self._mm.find(b"\n", start)
+        return self._mm[start:end if end != -1 else len(self._mm)].strip()
+
+    def get(self, sentence_id):
+        """Sentence text for an ID (only this line is decoded)"""
+        return self._line_bytes(sentence_id).decode("utf-8")
+
+    def find(self, sentence):
+        """ID of the first line equal to sentence, or None (scans the mmap in C, no decoding)"""
+        if self._mm is None:
+            return None
+        needle = sentence.strip().encode("utf-8")
+        if not needle:
+            return None
+        position = self._mm.find(needle)
+        while position != -1:
+            sentence_id = bisect_right(self.offsets, position) - 1
+            if sentence_id >= 0 and self._line_bytes(sentence_id) == needle:
+                return sentence_id
+            position = self._mm.find(needle, position + 1)
+        return None
+
+    def resolve(self, sentence, sentence_id=None):
+        """ID for a submitted sentence; trusts sentence_id only if it matches the text"""
+        if sentence_id is not None and 0 <= sentence_id < len(self.offsets) and self.get(sentence_id) == sentence.strip():
+            return sentence_id
+        return self.find(sentence)
+
+    def ids_matching(self, sentences):
+        """IDs of every line whose text is in sentences (one pass over the raw bytes)"""
+        wanted = {s.strip().encode("utf-8") for s in sentences}
+        if not wanted:
+            return []
+        return [sentence_id for sentence_id in range(len(self.offsets)) if self._line_bytes(sentence_id) in wanted]
@@ -0,0 +1,110 @@
+"""
+Shared-state mode for running several workers (uvicorn --workers N) on one
+host against one SQLite database.
+
+Enabled with SHARED_STATE=true, which requires STORAGE_BACKEND=sqlite:
+- recordings, sentence state and clip numbers live in the database
+- sentence leases use SQLiteLeaseStore (same database)
+- the upload outbox directory is shared and jobs are locked per worker
+- each worker keeps its in-memory metadata index and sentence pool, and
+  SharedStateSync catches them up on rows written by other workers (rows
+  carry their sentence ID, so no worker has to search sentences.txt)
+
+Settings (environment variables):
+- SHARED_STATE: "true" to enable (default: false)
+- STORAGE_DB_FILE / UPLOAD_OUTBOX_DIR: shared by all workers; keep them on a local disk,
+  as SQLite WAL and flock are unreliable on network filesystems. Clips are written to the
+  local clips/ directory, so instances on other hosts could not run each other's uploads.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def shared_state_enabled():
+    return os.getenv('SHARED_STATE', 'false').lower() in ('1', 'true', 'yes')
+
+
+@contextmanager
+def exclusive_startup(lock_file):
+    """Serialize startup work (Dropbox restore, sync, imports) across workers"""
+    if fcntl is None:
+        yield
+        return
+    with open(lock_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SharedStateSync:
+    """Keeps a worker's MetadataIndex and SentenceScheduler in step with the shared database"""
+
+    def __init__(self, storage, metadata_index, scheduler):
+        self.storage = storage
+        self.metadata_index = metadata_index
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._generation = None
+        self._last_id = 0
+        self._last_removal_id = 0
+        self._own = set()  # ids of rows this worker wrote and already applied
+
+    def reload(self):
+        """Rebuild the caches from scratch"""
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        self._data_version = self.storage.data_version()
+        self._generation = self.storage.generation()
+        self._last_id = self.storage.last_recording_id()
+        self._last_removal_id = self.storage.last_removal_id()
+        self._own.clear()
+        self.metadata_index.load(self.storage.iter_recordings())
+        self.scheduler.reload()
+
+    def applied(self, row_id):
+        """Note a row this worker wrote and already added to its caches, so sync() skips it"""
+        if row_id is not None:
+            with self._lock:
+                if row_id == self._last_id + 1:
+                    self._last_id = row_id  # Nothing from other workers in between
+                elif row_id > self._last_id:
+                    self._own.add(row_id)
+
+    def sync(self, force=False):
+        """Apply rows added or removed by other workers. Cheap when nothing changed (one PRAGMA).
+        force=True also applies this worker's own removals, which don't change data_version."""
+        with self._lock:
+            data_version = self.storage.data_version()
+            if not force and data_version == self._data_version:
+                return
+            self._data_version = data_version
+            if self.storage.generation() != self._generation:
+                self._reload()
+                return
+            added, removed = self.storage.changes_since(self._last_id, self._last_removal_id)
+            for removal_id, row_id, filepath, sentence, sentence_id in removed:
+                # Only rows in our caches: a row added and removed since the last sync was never applied
+                if row_id <= self._last_id or row_id in self._own:
+                    self._own.discard(row_id)
+                    if self.metadata_index.remove(filepath, sentence):
+                        self.scheduler.unmark_recorded(sentence, sentence_id)
+                self._last_removal_id = removal_id
+            for row_id, filepath, sentence, sentence_id in added:
+                if row_id in self._own:
+                    self._own.discard(row_id)
+                else:
+                    self.metadata_index.add(filepath, sentence)
+                    self.scheduler.mark_recorded(sentence, sentence_id)
+                self._last_id = row_id
@@ -0,0 +1,53 @@
+"""
+Energy-based silence trimming at ingest.
+
+Browser recordings start with the speaker's reaction time and end with the
+delay before they press stop - often a third of the clip. The decoded clip
+is split into 20 ms frames, frames quieter than SILENCE_TRIM_DBFS count as
+silence, and everything before the first / after the last voiced frame is
+cut, keeping SILENCE_TRIM_PADDING seconds on each side. The trimmed clip is
+what gets stored and uploaded.
+
+Settings (environment variables):
+- SILENCE_TRIM: "true" to enable (default: false; needs NumPy)
+- SILENCE_TRIM_DBFS: frame level below which a frame is silence (default: -45)
+- SILENCE_TRIM_PADDING: seconds of silence kept before and after speech (default: 0.25)
+"""
+
+import os
+
+from audio_quality import frame_levels, numpy_available, voiced_span
+
+
+class SilenceTrimmer:
+    def __init__(self, silence_dbfs=-45.0, padding=0.25):
+        self.silence_dbfs = silence_dbfs
+        self.padding = padding
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            silence_dbfs=float(os.getenv('SILENCE_TRIM_DBFS', '-45')),
+            padding=float(os.getenv('SILENCE_TRIM_PADDING', '0.25')),
+        )
+
+    @staticmethod
+    def enabled():
+        return numpy_available() and os.getenv('SILENCE_TRIM', 'false').lower() in ('1', 'true', 'yes')
+
+    def bounds(self, samples, sample_rate):
+        """(start, end) sample indices to keep; the whole clip if no frame is voiced"""
+        levels, frame_length = frame_levels(samples, sample_rate)
+        first, last = voiced_span(levels, self.silence_dbfs)
+        if last == 0:
+            # Leave silent clips alone - the quality check decides what to do with them
+            return 0, len(samples)
+        pad = int(self.padding * sample_rate)
+        return max(0, first * frame_length - pad), min(len(samples), last * frame_length + pad)
+
+    def trim(self, clip):
+        """Trimmed PcmClip (the same clip if there is nothing to cut)"""
+        start, end = self.bounds(clip.mono, clip.sample_rate)
+        if start == 0 and end == len(clip.frames):
+            return clip
+        return clip.slice(start, end)
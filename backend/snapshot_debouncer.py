@@ -0,0 +1,67 @@
+"""
+Debounced backups of metadata.csv / sentence_state.json.
+
+Re-uploading both files after every clip makes upload traffic grow
+quadratically with the dataset. Changes are coalesced instead: a snapshot
+is queued at most once per interval, or as soon as max_rows new rows have
+accumulated, plus a final flush on shutdown.
+
+Settings (environment variables):
+- SNAPSHOT_INTERVAL: minimum seconds between snapshot uploads (default: 60)
+- SNAPSHOT_MAX_ROWS: new rows that force a snapshot before the interval ends (default: 25)
+"""
+
+import asyncio
+import os
+import time
+
+
+class SnapshotDebouncer:
+    def __init__(self, flush, interval=60.0, max_rows=25):
+        """flush is called (on the event loop) whenever a snapshot should be queued"""
+        self.flush_func = flush
+        self.interval = interval
+        self.max_rows = max_rows
+        self.pending_rows = 0
+        self.last_flush = None
+        self._timer = None
+
+    @classmethod
+    def from_env(cls, flush):
+        return cls(
+            flush,
+            interval=float(os.getenv('SNAPSHOT_INTERVAL', '60')),
+            max_rows=int(os.getenv('SNAPSHOT_MAX_ROWS', '25')),
+        )
+
+    def note_change(self, rows=1):
+        """Register new metadata rows; queues a snapshot now or schedules one"""
+        self.pending_rows += rows
+        now = time.monotonic()
+        if self.pending_rows >= self.max_rows or self.last_flush is None or now - self.last_flush >= self.interval:
+            self.flush()
+        elif self._timer is None:
+            delay = self.interval - (now - self.last_flush)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        if self.pending_rows:
+            self.flush()
+
+    def flush(self):
+        """Queue a snapshot right away (no-op if nothing changed since the last one)"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending_rows:
+            return
+        rows = self.pending_rows
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        try:
+            self.flush_func()
+            print(f"📸 Queued state snapshot ({rows} new rows)")
+        except Exception as e:
+            self.pending_rows += rows
+            print(f"⚠️ Failed to queue state snapshot: {e}")
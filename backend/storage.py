@@ -0,0 +1,629 @@
+"""
+Storage backends for recordings metadata and sentence state.
+
+Two interchangeable backends are available, selected with STORAGE_BACKEND:
+- "files" (default): metadata.csv + sentence_state.json, as before
+- "sqlite": an embedded SQLite database in WAL mode with indexed tables for
+  recordings, sentences and speakers. metadata.csv / sentence_state.json are
+  only written on demand via export_files() (e.g. before a Dropbox backup).
+
+Per-clip quality metrics (see audio_quality.py), the clip's storage codec
+(see transcoder.py) and the SHA-256 / idempotency key of the upload it was
+made from are kept next to the metadata: quality.csv for the files backend,
+a recording_quality table for SQLite (exported to quality.csv).
+find_upload() looks a submission up by the latter two, so retried uploads
+can be answered with the clip that was already stored.
+
+Both backends hand out clip numbers from a persistent sequence
+(next_clip_number) that is atomic across threads and worker processes.
+The sequence is kept in a clip_sequence file (exported from the database for
+SQLite) that is backed up with the metadata, so numbers used up by rejected
+or deleted clips are not handed out again after a restore.
+
+The SQLite backend can be shared by several workers (see shared_state.py):
+bulk rewrites bump a "generation" counter so other workers know to rebuild
+their in-memory caches, and changes_since() lets them catch up on rows added
+or removed elsewhere.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metadata_index import parse_speaker
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+METADATA_HEADER = "filename|sentence\n"
+# Per-clip columns of quality.csv / recording_quality; QUALITY_FIELDS are the metrics
+# computed by audio_quality.analyze (kept here so importing storage doesn't load NumPy)
+QUALITY_FIELDS = (
+    "duration", "rms_dbfs", "peak_dbfs", "clipping_ratio",
+    "leading_silence", "trailing_silence", "noise_floor_dbfs", "snr_db",
+)
+CLIP_TEXT_FIELDS = ("codec", "upload_sha256", "idempotency_key")
+CLIP_FIELDS = CLIP_TEXT_FIELDS + QUALITY_FIELDS
+QUALITY_HEADER = "|".join(("filename",) + CLIP_FIELDS) + "\n"
+
+
+def _write_atomic(path, write):
+    """Write a file via a temp file + rename so readers (e.g. uploads) never see it half-written"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _append_line(path, line, header=None):
+    """Append one line under an exclusive file lock, writing header first if the file is new"""
+    with open(path, "a", encoding="utf-8") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if header and f.tell() == 0:
+                f.write(header)
+            f.write(line)
+            f.flush()
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _quality_line(filename, quality):
+    return "|".join([filename] + [str(quality.get(field, "")) for field in CLIP_FIELDS]) + "\n"
+
+
+def _clip_info(quality, codec, upload_sha256=None, idempotency_key=None):
+    """quality.csv row values: quality metrics plus the storage codec and the upload's hash / key"""
+    info = dict(quality or {})
+    for field, value in (("codec", codec), ("upload_sha256", upload_sha256), ("idempotency_key", idempotency_key)):
+        if value:
+            info[field] = value
+    return info
+
+
+def _default_quality_file(metadata_file):
+    return os.path.join(os.path.dirname(metadata_file), "quality.csv")
+
+
+def _default_sequence_file(metadata_file):
+    return os.path.join(os.path.dirname(metadata_file), "clip_sequence")
+
+
+def _read_sequence(path):
+    """Last clip number stored in a clip_sequence file (0 if missing or unreadable)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+class FileStorage:
+    """metadata.csv + sentence_state.json storage (original file layout)"""
+
+    def __init__(self, state_file, metadata_file, sequence_file=None, quality_file=None):
+        self.state_file = state_file
+        self.metadata_file = metadata_file
+        self.quality_file = quality_file or _default_quality_file(metadata_file)
+        self.sequence_file = sequence_file or _default_sequence_file(metadata_file)
+        self._lock = threading.Lock()
+        self._uploads = None  # find_upload index, built on first use
+        self._uploads_size = None  # quality.csv size the index reflects; another worker appending changes it
+
+    def init(self):
+        """Create empty state/metadata files if they don't exist"""
+        if not os.path.exists(self.state_file):
+            with open(self.state_file, "w", encoding="utf-8") as f:
+                json.dump({"recorded": []}, f, ensure_ascii=False)
+        if not os.path.exists(self.metadata_file):
+            with open(self.metadata_file, "w", encoding="utf-8") as f:
+                f.write(METADATA_HEADER)
+        if os.path.exists(self.quality_file):
+            with open(self.quality_file, "r", encoding="utf-8") as f:
+                header = f.readline()
+            if header and header != QUALITY_HEADER:
+                # Written by an older version (e.g. without the codec column) - rewrite with current columns
+                self.replace_quality(list(self.iter_quality()))
+
+    def reset(self):
+        """Drop all recordings and progress"""
+        with self._lock:
+            self._uploads = None
+            _write_atomic(self.state_file, lambda f: json.dump({"recorded": []}, f, ensure_ascii=False))
+            _write_atomic(self.metadata_file, lambda f: f.write(METADATA_HEADER))
+            _write_atomic(self.quality_file, lambda f: f.write(QUALITY_HEADER))
+
+    def load_state(self):
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_state(self, state):
+        _write_atomic(self.state_file, lambda f: json.dump(state, f, ensure_ascii=False, indent=2))
+
+    def save_state(self, state):
+        with self._lock:
+            self._write_state(state)
+
+    def mark_recorded(self, sentence):
+        """Add a sentence to the recorded list (no-op if already there)"""
+        with self._lock:
+            state = self.load_state()
+            recorded = state.get("recorded", [])
+            if sentence in recorded:
+                return
+            recorded.append(sentence)
+            state["recorded"] = recorded
+            self._write_state(state)
+
+    def append_recording(self, filepath, sentence, quality=None, codec=None, upload_sha256=None, idempotency_key=None,
+                         sentence_id=None):
+        """Append one row to metadata.csv (and its metrics/codec/upload hash to quality.csv) under an exclusive file lock.
+        sentence_id is only kept by the SQLite backend (for shared state); metadata.csv has no column for it."""
+        info = _clip_info(quality, codec, upload_sha256, idempotency_key)
+        with self._lock:
+            _append_line(self.metadata_file, f"{filepath}|{sentence}\n")
+            if info:
+                indexed = self._uploads is not None and self._uploads_size == _file_size(self.quality_file)
+                _append_line(self.quality_file, _quality_line(os.path.basename(filepath), info), QUALITY_HEADER)
+                if indexed:
+                    self._index_upload(os.path.basename(filepath), sentence, info)
+                    self._uploads_size = _file_size(self.quality_file)
+
+    def _index_upload(self, filename, sentence, info):
+        if info.get("idempotency_key"):
+            self._uploads.setdefault(("idempotency_key", info["idempotency_key"]), (filename, sentence))
+        if info.get("upload_sha256"):
+            self._uploads.setdefault(("upload_sha256", (info["upload_sha256"], sentence)), (filename, sentence))
+
+    def find_upload(self, upload_sha256=None, idempotency_key=None, sentence=None):
+        """(filename, sentence) of the recording stored from an upload with this idempotency key,
+        else from this content hash for this sentence; None if there is none. O(1) after the
+        first call, which indexes quality.csv."""
+        with self._lock:
+            if self._uploads is None or self._uploads_size != _file_size(self.quality_file):
+                self._uploads = {}
+                self._uploads_size = _file_size(self.quality_file)
+                sentences = {os.path.basename(filepath): sentence for filepath, sentence in self.iter_recordings()}
+                for filename, info in self.iter_quality():
+                    if filename in sentences:
+                        self._index_upload(filename, sentences[filename], info)
+            if idempotency_key and ("idempotency_key", idempotency_key) in self._uploads:
+                return self._uploads[("idempotency_key", idempotency_key)]
+            if upload_sha256 and ("upload_sha256", (upload_sha256, sentence)) in self._uploads:
+                return self._uploads[("upload_sha256", (upload_sha256, sentence))]
+        return None
+
+    def next_clip_number(self, floor=0):
+        """Allocate the next clip number from a file-locked counter (never below floor + 1)"""
+        with self._lock:
+            fd = os.open(self.sequence_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    current = int(os.read(fd, 32).decode().strip() or 0)
+                except ValueError:
+                    current = 0  # Torn write - floor keeps numbers ahead of existing clips
+                number = max(current, floor) + 1
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, f"{number}\n".encode(), 0)
+                os.fsync(fd)
+                return number
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def iter_recordings(self):
+        """Yield (filepath, sentence) for every recording"""
+        if not os.path.exists(self.metadata_file):
+            return
+        with open(self.metadata_file, "r", encoding="utf-8") as f:
+            next(f, None)  # Skip header
+            for line in f:
+                if line.strip() and '|' in line:
+                    filepath, sentence = line.strip().split('|', 1)
+                    yield filepath, sentence
+
+    def iter_quality(self):
+        """Yield (filename, metrics dict incl. "codec") for every row of quality.csv"""
+        if not os.path.exists(self.quality_file):
+            return
+        with open(self.quality_file, "r", encoding="utf-8") as f:
+            # Columns come from the header so files from older versions still parse
+            columns = next(f, "").rstrip("\n").split("|")[1:]
+            for line in f:
+                values = line.rstrip("\n").split("|")
+                if len(values) == len(columns) + 1:
+                    yield values[0], {
+                        field: value if field in CLIP_TEXT_FIELDS else float(value)
+                        for field, value in zip(columns, values[1:]) if value and field in CLIP_FIELDS
+                    }
+
+    def replace_quality(self, rows):
+        """Rewrite quality.csv with the given (filename, metrics dict) rows"""
+        def write(f):
+            f.write(QUALITY_HEADER)
+            f.writelines(_quality_line(filename, quality) for filename, quality in rows)
+
+        with self._lock:
+            _write_atomic(self.quality_file, write)
+            self._uploads = None
+
+    def replace_recordings(self, rows):
+        """Rewrite metadata.csv with the given (filepath, sentence) rows"""
+        def write(f):
+            f.write(METADATA_HEADER)
+            f.writelines(f"{filepath}|{sentence}\n" for filepath, sentence in rows)
+
+        with self._lock:
+            _write_atomic(self.metadata_file, write)
+            self._uploads = None
+
+    def remove_recordings(self, filenames):
+        """Drop the rows of the given clip filenames and unmark sentences left without a recording.
+        Runs under the storage lock, so rows appended meanwhile are kept. Returns the removed
+        (filepath, sentence, sentence_id) rows; sentence_id is always None here (not in metadata.csv)."""
+        filenames = set(filenames)
+        kept, removed = [], []
+
+        def write(f):
+            f.write(METADATA_HEADER)
+            f.writelines(f"{filepath}|{sentence}\n" for filepath, sentence in kept)
+
+        with self._lock:
+            for row in self.iter_recordings():
+                (removed if os.path.basename(row[0]) in filenames else kept).append(row)
+            if not removed:
+                return []
+            _write_atomic(self.metadata_file, write)
+            self._uploads = None
+            orphaned = {sentence for _, sentence in removed} - {sentence for _, sentence in kept}
+            if orphaned:
+                state = self.load_state()
+                state["recorded"] = [sentence for sentence in state.get("recorded", []) if sentence not in orphaned]
+                self._write_state(state)
+        return [(filepath, sentence, None) for filepath, sentence in removed]
+
+    def export_files(self, state_file=None, metadata_file=None):
+        """Files (including quality.csv) are already the source of truth - nothing to export"""
+        return self.state_file, self.metadata_file
+
+
+class SQLiteStorage:
+    """SQLite (WAL) storage with indexed recordings/sentences/speakers tables"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS recordings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL UNIQUE,
+            filepath TEXT NOT NULL,
+            sentence TEXT NOT NULL,
+            speaker TEXT,
+            created_at REAL NOT NULL,
+            sentence_id INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_recordings_sentence ON recordings(sentence);
+        CREATE INDEX IF NOT EXISTS idx_recordings_speaker ON recordings(speaker);
+        CREATE TABLE IF NOT EXISTS sentences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL UNIQUE,
+            recorded_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS speakers (
+            name TEXT PRIMARY KEY,
+            recording_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS removals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recording_id INTEGER NOT NULL,
+            filepath TEXT NOT NULL,
+            sentence TEXT NOT NULL,
+            sentence_id INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS recording_quality (
+            filename TEXT PRIMARY KEY,
+""" + "".join(f"            {field} TEXT,\n" for field in CLIP_TEXT_FIELDS) \
+    + ",\n".join(f"            {field} REAL" for field in QUALITY_FIELDS) + """
+        );
+    """
+
+    def __init__(self, db_file, state_file, metadata_file, quality_file=None, sequence_file=None):
+        self.db_file = db_file
+        self.state_file = state_file
+        self.metadata_file = metadata_file
+        self.quality_file = quality_file or _default_quality_file(metadata_file)
+        self.sequence_file = sequence_file or _default_sequence_file(metadata_file)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns introduced after a database was created"""
+        if "sentence_id" not in {row[1] for row in self._conn.execute("PRAGMA table_info(recordings)")}:
+            try:
+                self._conn.execute("ALTER TABLE recordings ADD COLUMN sentence_id INTEGER")
+            except sqlite3.OperationalError:
+                pass  # Another worker added it first
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(recording_quality)")}
+        for field in CLIP_FIELDS:
+            if field not in columns:
+                try:
+                    column_type = "TEXT" if field in CLIP_TEXT_FIELDS else "REAL"
+                    self._conn.execute(f"ALTER TABLE recording_quality ADD COLUMN {field} {column_type}")
+                except sqlite3.OperationalError:
+                    pass  # Another worker added it first
+        # find_upload lookups
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_quality_upload_sha256 ON recording_quality(upload_sha256)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_quality_idempotency_key ON recording_quality(idempotency_key)")
+
+    @contextmanager
+    def _write(self):
+        """Run a block inside a single IMMEDIATE transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def init(self):
+        """Tables are created on connect - nothing else to do"""
+
+    def _bump_generation(self, conn):
+        conn.execute(
+            "INSERT INTO sequences (name, value) VALUES ('generation', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+
+    def reset(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM recordings")
+            conn.execute("DELETE FROM sentences")
+            conn.execute("DELETE FROM speakers")
+            conn.execute("DELETE FROM recording_quality")
+            conn.execute("DELETE FROM removals")
+            self._bump_generation(conn)
+
+    def is_empty(self):
+        return not self._query("SELECT 1 FROM recordings LIMIT 1") and \
+            not self._query("SELECT 1 FROM sentences LIMIT 1")
+
+    def load_state(self):
+        rows = self._query("SELECT text FROM sentences ORDER BY id")
+        return {"recorded": [text for (text,) in rows]}
+
+    def save_state(self, state):
+        now = time.time()
+        with self._write() as conn:
+            conn.execute("DELETE FROM sentences")
+            conn.executemany(
+                "INSERT OR IGNORE INTO sentences (text, recorded_at) VALUES (?, ?)",
+                ((text, now) for text in state.get("recorded", []))
+            )
+            self._bump_generation(conn)
+
+    def mark_recorded(self, sentence):
+        with self._write() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO sentences (text, recorded_at) VALUES (?, ?)",
+                (sentence, time.time())
+            )
+
+    def _insert_recording(self, conn, filepath, sentence, sentence_id=None):
+        """Insert one recording; returns its row id (None if the filename was already there)"""
+        filename = os.path.basename(filepath)
+        speaker = parse_speaker(filename)
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO recordings (filename, filepath, sentence, speaker, created_at, sentence_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (filename, filepath, sentence, speaker, time.time(), sentence_id)
+        )
+        if not cursor.rowcount:
+            return None
+        if speaker:
+            conn.execute(
+                "INSERT INTO speakers (name, recording_count) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET recording_count = recording_count + 1",
+                (speaker,)
+            )
+        return cursor.lastrowid
+
+    def _insert_quality(self, conn, filename, quality):
+        conn.execute(
+            f"INSERT OR REPLACE INTO recording_quality (filename, {', '.join(CLIP_FIELDS)}) "
+            f"VALUES (?{', ?' * len(CLIP_FIELDS)})",
+            (filename,) + tuple(quality.get(field) for field in CLIP_FIELDS)
+        )
+
+    def append_recording(self, filepath, sentence, quality=None, codec=None, upload_sha256=None, idempotency_key=None,
+                         sentence_id=None):
+        """Insert one recording with its clip info; returns its row id (see recordings_since)"""
+        info = _clip_info(quality, codec, upload_sha256, idempotency_key)
+        with self._write() as conn:
+            row_id = self._insert_recording(conn, filepath, sentence, sentence_id)
+            if info:
+                self._insert_quality(conn, os.path.basename(filepath), info)
+        return row_id
+
+    def iter_quality(self):
+        for row in self._query(f"SELECT filename, {', '.join(CLIP_FIELDS)} FROM recording_quality ORDER BY rowid"):
+            yield row[0], {field: value for field, value in zip(CLIP_FIELDS, row[1:]) if value is not None}
+
+    def find_upload(self, upload_sha256=None, idempotency_key=None, sentence=None):
+        lookups = []
+        if idempotency_key:
+            lookups.append(("q.idempotency_key = ?", (idempotency_key,)))
+        if upload_sha256:
+            lookups.append(("q.upload_sha256 = ? AND r.sentence = ?", (upload_sha256, sentence)))
+        for condition, params in lookups:
+            rows = self._query(
+                "SELECT q.filename, r.sentence FROM recording_quality q "
+                f"JOIN recordings r ON r.filename = q.filename WHERE {condition} ORDER BY r.id LIMIT 1",
+                params
+            )
+            if rows:
+                return rows[0]
+        return None
+
+    def next_clip_number(self, floor=0):
+        """Allocate the next clip number; BEGIN IMMEDIATE serializes workers sharing the database"""
+        with self._write() as conn:
+            conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('clip', 0)")
+            conn.execute("UPDATE sequences SET value = max(value, ?) + 1 WHERE name = 'clip'", (floor,))
+            (number,) = conn.execute("SELECT value FROM sequences WHERE name = 'clip'").fetchone()
+        return number
+
+    def clip_sequence(self):
+        """Last clip number handed out (0 if none)"""
+        rows = self._query("SELECT value FROM sequences WHERE name = 'clip'")
+        return rows[0][0] if rows else 0
+
+    def iter_recordings(self):
+        for filepath, sentence in self._query("SELECT filepath, sentence FROM recordings ORDER BY id"):
+            yield filepath, sentence
+
+    def data_version(self):
+        """Changes whenever another connection (e.g. another worker) commits"""
+        return self._query("PRAGMA data_version")[0][0]
+
+    def generation(self):
+        """Bumped by bulk rewrites (reset, save_state, replace_recordings, import_files)"""
+        rows = self._query("SELECT value FROM sequences WHERE name = 'generation'")
+        return rows[0][0] if rows else 0
+
+    def last_recording_id(self):
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM recordings")[0][0]
+
+
+    def last_removal_id(self):
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM removals")[0][0]
+
+    def changes_since(self, after_id, after_removal_id):
+        """Rows added after recording id after_id - (id, filepath, sentence, sentence_id) - and rows removed
+        after removal id after_removal_id - (id, recording_id, filepath, sentence, sentence_id) -, oldest
+        first. Both are read from the same snapshot of the database."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                added = self._conn.execute(
+                    "SELECT id, filepath, sentence, sentence_id FROM recordings WHERE id > ? ORDER BY id", (after_id,)
+                ).fetchall()
+                removed = self._conn.execute(
+                    "SELECT id, recording_id, filepath, sentence, sentence_id FROM removals WHERE id > ? ORDER BY id",
+                    (after_removal_id,)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        return added, removed
+
+    def replace_recordings(self, rows):
+        with self._write() as conn:
+            conn.execute("DELETE FROM recordings")
+            conn.execute("DELETE FROM speakers")
+            for filepath, sentence in rows:
+                self._insert_recording(conn, filepath, sentence)
+            self._bump_generation(conn)
+
+    def remove_recordings(self, filenames):
+        """Drop the rows of the given clip filenames and unmark sentences left without a recording.
+        Logged in removals (instead of bumping the generation) so other workers apply just these
+        rows. Returns the removed (filepath, sentence, sentence_id) rows."""
+        removed = []
+        with self._write() as conn:
+            for filename in set(filenames):
+                row = conn.execute(
+                    "SELECT id, filepath, sentence, speaker, sentence_id FROM recordings WHERE filename = ?",
+                    (filename,)
+                ).fetchone()
+                if row is None:
+                    continue
+                recording_id, filepath, sentence, speaker, sentence_id = row
+                conn.execute("DELETE FROM recordings WHERE id = ?", (recording_id,))
+                conn.execute(
+                    "INSERT INTO removals (recording_id, filepath, sentence, sentence_id) VALUES (?, ?, ?, ?)",
+                    (recording_id, filepath, sentence, sentence_id)
+                )
+                if speaker:
+                    conn.execute(
+                        "UPDATE speakers SET recording_count = recording_count - 1 WHERE name = ?", (speaker,)
+                    )
+                removed.append((filepath, sentence, sentence_id))
+            if not removed:
+                return []
+            conn.execute("DELETE FROM speakers WHERE recording_count <= 0")
+            for sentence in {sentence for _, sentence, _ in removed}:
+                if conn.execute("SELECT 1 FROM recordings WHERE sentence = ? LIMIT 1", (sentence,)).fetchone() is None:
+                    conn.execute("DELETE FROM sentences WHERE text = ?", (sentence,))
+        return removed
+
+    def import_files(self, state_file=None, metadata_file=None):
+        """One-shot import of existing sentence_state.json / metadata.csv into the database"""
+        files = FileStorage(state_file or self.state_file, metadata_file or self.metadata_file)
+        rows = list(files.iter_recordings())
+        recorded = files.load_state().get("recorded", []) if os.path.exists(files.state_file) else []
+        quality_rows = list(files.iter_quality())
+        sequence = _read_sequence(self.sequence_file)
+        now = time.time()
+        with self._write() as conn:
+            for filepath, sentence in rows:
+                self._insert_recording(conn, filepath, sentence)
+            for filename, quality in quality_rows:
+                self._insert_quality(conn, filename, quality)
+            conn.executemany(
+                "INSERT OR IGNORE INTO sentences (text, recorded_at) VALUES (?, ?)",
+                ((text, now) for text in recorded)
+            )
+            conn.execute(
+                "INSERT INTO sequences (name, value) VALUES ('clip', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = max(value, excluded.value)",
+                (sequence,)
+            )
+            self._bump_generation(conn)
+        return len(rows), len(recorded)
+
+    def export_files(self, state_file=None, metadata_file=None):
+        """Write the database out as sentence_state.json / metadata.csv"""
+        files = FileStorage(state_file or self.state_file, metadata_file or self.metadata_file)
+        files.replace_recordings(self.iter_recordings())
+        files.replace_quality(self.iter_quality())
+        files.save_state(self.load_state())
+        _write_atomic(self.sequence_file, lambda f: f.write(f"{self.clip_sequence()}\n"))
+        return files.state_file, files.metadata_file
+
+
+def create_storage(state_file, metadata_file):
+    """Build the storage backend selected by STORAGE_BACKEND ("files" or "sqlite")"""
+    backend = os.getenv('STORAGE_BACKEND', 'files').lower()
+    if backend == 'sqlite':
+        db_file = os.getenv('STORAGE_DB_FILE', 'recordings.db')
+        print(f"🗄️ Using SQLite storage: {db_file}")
+        return SQLiteStorage(db_file, state_file, metadata_file)
+    return FileStorage(state_file, metadata_file)
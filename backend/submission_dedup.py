@@ -0,0 +1,65 @@
+"""
+Idempotent recording submissions.
+
+A client that times out while /submit_recording is still working retries
+with the same audio. Each submission is identified by the Idempotency-Key
+header the client sends (one key per recording) and by the SHA-256 of the
+uploaded bytes, computed while the upload is streamed to disk. A retry is
+answered with the clip that was already stored, without transcoding or
+uploading anything again:
+
+- submissions that finished are found through storage.find_upload(), whose
+  index is kept next to the metadata (quality.csv / recording_quality)
+- submissions still being processed are tracked here, so a retry that
+  arrives meanwhile waits for the original's outcome
+
+A content-hash match only counts for the same sentence, so a recording is
+never silently attributed to a different sentence. Concurrent retries are
+only coalesced within one worker; across workers the stored index catches
+them once the original finished.
+"""
+
+import asyncio
+import re
+
+# Clients send a UUID; anything that could break the quality.csv row is rejected
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"[A-Za-z0-9_.:-]{1,128}")
+
+
+def valid_idempotency_key(key):
+    return bool(IDEMPOTENCY_KEY_PATTERN.fullmatch(key))
+
+
+class InflightSubmissions:
+    def __init__(self):
+        self._pending = {}  # ("idempotency_key", key) | ("upload_sha256", (sha, sentence)) -> future of (filename, sentence)
+
+    def find(self, keys):
+        """Future of a submission in progress with any of these keys, or None"""
+        for key in keys:
+            if key in self._pending:
+                return self._pending[key]
+        return None
+
+    async def wait(self, keys):
+        """Outcome of a submission in progress with any of these keys: (filename, sentence),
+        or None if there is none or it failed"""
+        future = self.find(keys)
+        if future is None:
+            return None
+        # Shielded: a retry that disconnects must not cancel the original's future
+        return await asyncio.shield(future)
+
+    def begin(self, keys):
+        future = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._pending.setdefault(key, future)
+        return future
+
+    def finish(self, keys, future, result=None):
+        """Publish the outcome ((filename, sentence), or None if the submission failed)"""
+        for key in keys:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,260 @@
+"""
+Audio transcoding off the event loop.
+
+Uploads are converted with a single ffmpeg process: the uploaded bytes are
+piped in on stdin and the canonical dataset format (16 kHz mono s16le WAV by
+default) is written straight to the clip path. Output is bit-exact, so the
+same upload always produces the same bytes.
+
+Clips are stored with a compressed codec (CLIP_CODEC): lossless FLAC by
+default (about half the size of WAV and decodes back to identical samples) or
+Opus (around 10x smaller, lossy). Uploads are first decoded to canonical WAV
+for trimming / quality analysis, then encoded for storage; materialize_wav.py
+turns stored clips back into WAV for training pipelines that need it.
+
+Jobs run in a bounded ProcessPoolExecutor: N concurrent submissions use N
+cores while the uvicorn event loop stays free for /health, /next_sentence, etc.
+
+Settings (environment variables):
+- TRANSCODE_WORKERS: worker processes (default: CPU count)
+- TRANSCODE_MAX_QUEUE: max jobs running + waiting in the pool (default: 16 x workers); further jobs
+  wait for a slot
+- TRANSCODE_QUEUE_TIMEOUT: seconds a job waits for a slot before it is refused (default: 30)
+- TRANSCODE_TIMEOUT: seconds allowed per job (default: 60)
+- CLIP_SAMPLE_RATE / CLIP_CHANNELS: canonical clip format (default: 16000 Hz, mono)
+- CLIP_CODEC: storage codec, "flac", "opus" or "wav" (default: flac)
+- CLIP_OPUS_BITRATE: Opus bitrate (default: 32k)
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from audio_format import WAVE_FORMAT_PCM, read_wav_format, sniff_audio_format
+
+FFMPEG = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+
+# Containers ffmpeg can demux from a pipe; MP4 needs to seek (moov atom), so it is read from the path
+STREAMABLE_FORMATS = {"webm", "ogg", "wav", "flac"}
+
+# Storage codecs: file extension, ffmpeg encoder and output options
+CLIP_CODECS = {
+    "wav": (".wav", "pcm_s16le", ["-f", "wav"]),
+    "flac": (".flac", "flac", ["-compression_level", "8", "-f", "flac"]),
+    "opus": (".opus", "libopus", ["-application", "voip", "-f", "ogg"]),
+}
+
+
+class TranscoderBusy(Exception):
+    """Raised when a job waited TRANSCODE_QUEUE_TIMEOUT seconds without getting a slot"""
+
+
+class TranscodeTimeout(Exception):
+    """Raised when a job exceeds its time limit"""
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg cannot decode the upload"""
+
+
+def ffmpeg_available():
+    return shutil.which(FFMPEG) is not None
+
+
+def encoder_available(encoder):
+    """True if the ffmpeg build includes the given audio encoder (e.g. libopus)"""
+    try:
+        result = subprocess.run([FFMPEG, "-hide_banner", "-encoders"], capture_output=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return any(line.split()[1:2] == [encoder] for line in result.stdout.decode("utf-8", "replace").splitlines())
+
+
+def build_ffmpeg_command(input_format, src_path, dst_path, sample_rate, channels, codec="wav", opus_bitrate="32k"):
+    command = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y"]
+    if input_format in STREAMABLE_FORMATS:
+        command += ["-f", "matroska" if input_format == "webm" else input_format, "-i", "pipe:0"]
+    else:
+        command += ["-i", src_path]
+    command += [
+        "-vn", "-map_metadata", "-1",
+        "-ac", str(channels), "-ar", str(sample_rate),
+    ]
+    _, encoder, options = CLIP_CODECS[codec]
+    command += ["-c:a", encoder]
+    if codec == "opus":
+        command += ["-b:a", opus_bitrate]
+    command += ["-fflags", "+bitexact", "-flags:a", "+bitexact", *options, dst_path]
+    return command
+
+
+def transcode(src_path, dst_path, input_format=None, sample_rate=16000, channels=1, codec="wav",
+              opus_bitrate="32k", timeout=None):
+    """Transcode audio to the canonical format with one ffmpeg run (runs in a worker process).
+    input_format comes from audio_format.sniff_audio_format; None lets ffmpeg auto-detect.
+    codec is a CLIP_CODECS key: canonical PCM WAV by default, or a storage codec."""
+    command = build_ffmpeg_command(input_format, src_path, dst_path, sample_rate, channels, codec, opus_bitrate)
+    with open(src_path, "rb") as src:
+        try:
+            result = subprocess.run(
+                command,
+                stdin=src if input_format in STREAMABLE_FORMATS else subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise TranscodeTimeout("Transcoding timed out")
+    if result.returncode != 0:
+        raise TranscodeError(result.stderr.decode("utf-8", "replace").strip() or "ffmpeg failed")
+    return dst_path
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _call(func, args, kwargs):
+    return func(*args, **kwargs)
+
+
+class Transcoder:
+    def __init__(self, workers=None, max_queue=None, timeout=60.0, sample_rate=16000, channels=1,
+                 codec="flac", opus_bitrate="32k", queue_timeout=30.0):
+        if codec not in CLIP_CODECS:
+            raise ValueError(f"Unknown clip codec {codec!r} (expected one of: {', '.join(CLIP_CODECS)})")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue or self.workers * 16
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.codec = codec
+        self.opus_bitrate = opus_bitrate
+        self.pending = 0
+        self.waiting = 0
+        self._executor = None
+        self._slots = None  # asyncio.Semaphore(max_queue), created on the event loop
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv('TRANSCODE_WORKERS', '0')) or None,
+            max_queue=int(os.getenv('TRANSCODE_MAX_QUEUE', '0')) or None,
+            timeout=float(os.getenv('TRANSCODE_TIMEOUT', '60')),
+            sample_rate=int(os.getenv('CLIP_SAMPLE_RATE', '16000')),
+            channels=int(os.getenv('CLIP_CHANNELS', '1')),
+            codec=os.getenv('CLIP_CODEC', 'flac').lower(),
+            opus_bitrate=os.getenv('CLIP_OPUS_BITRATE', '32k'),
+            queue_timeout=float(os.getenv('TRANSCODE_QUEUE_TIMEOUT', '30')),
+        )
+
+    @property
+    def extension(self):
+        """File extension of stored clips"""
+        return CLIP_CODECS[self.codec][0]
+
+    def codec_available(self):
+        """True if ffmpeg can encode the storage codec (Opus needs an ffmpeg built with libopus)"""
+        return ffmpeg_available() and (self.codec != "opus" or encoder_available(CLIP_CODECS["opus"][1]))
+
+    def matches_target(self, path):
+        """True if a WAV file is already in the canonical clip format"""
+        return read_wav_format(path) == {
+            "format": WAVE_FORMAT_PCM,
+            "channels": self.channels,
+            "sample_rate": self.sample_rate,
+            "bits_per_sample": 16,
+        }
+
+    def start(self):
+        """Create the worker pool and fork the workers up front"""
+        if self._executor:
+            return
+        # fork (not spawn) so workers don't re-import main.py and reconnect to Dropbox
+        context = multiprocessing.get_context("fork") if hasattr(os, "fork") else None
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        for future in [self._executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+        print(f"🎛️ Transcoder started: {self.workers} workers, queue limit {self.max_queue}, "
+              f"timeout {self.timeout:.0f}s, output {self.sample_rate} Hz x {self.channels} ch")
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs, timeout=...) in the pool; raises TranscoderBusy / TranscodeTimeout"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        # A burst waits for a slot instead of being refused right away
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise TranscoderBusy(f"No transcoding slot within {self.queue_timeout:g}s ({self.pending} jobs)")
+        finally:
+            self.waiting -= 1
+        self.start()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, _call, func, args, dict(kwargs, timeout=self.timeout))
+            try:
+                # The worker enforces the timeout itself; this is a backstop if it hangs
+                return await asyncio.wait_for(future, timeout=self.timeout + 5)
+            except asyncio.TimeoutError:
+                raise TranscodeTimeout("Transcoding timed out")
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer) - rebuild the pool on the next job
+                print("⚠️ Transcoding pool broken - restarting workers")
+                self.shutdown()
+                raise
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    async def convert(self, src_path, dst_path, input_format=None, codec="wav"):
+        """Transcode an upload to the canonical clip format at dst_path (PCM WAV unless codec is given)"""
+        return await self.run(
+            transcode, src_path, dst_path, input_format,
+            sample_rate=self.sample_rate, channels=self.channels, codec=codec, opus_bitrate=self.opus_bitrate
+        )
+
+    async def encode(self, wav_path, dst_path):
+        """Encode a canonical WAV clip with the storage codec"""
+        return await self.convert(wav_path, dst_path, "wav", codec=self.codec)
+
+
+# Determinism check: transcode a file twice and compare the outputs
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python3 transcoder.py <recording>")
+        sys.exit(1)
+
+    transcoder = Transcoder.from_env()
+    source = sys.argv[1]
+    detected = sniff_audio_format(source)
+    digests = []
+    for attempt in range(2):
+        output = f"{source}.check{attempt}{transcoder.extension}"
+        transcode(source, output, detected, transcoder.sample_rate, transcoder.channels,
+                  transcoder.codec, transcoder.opus_bitrate, transcoder.timeout)
+        with open(output, "rb") as f:
+            digests.append(hashlib.sha256(f.read()).hexdigest())
+        os.remove(output)
+
+    print(f"Input format: {detected or 'auto-detect'}")
+    print(f"Output SHA-256: {digests[0]}")
+    if digests[0] == digests[1]:
+        print("✅ Output is byte-identical across runs")
+    else:
+        print("❌ Output differs between runs")
+        sys.exit(1)
@@ -0,0 +1,344 @@
+"""
+Durable outbox for cloud uploads (Dropbox / Google Drive).
+
+Every pending upload is a small JSON job file in the outbox directory, so
+nothing is lost if the server restarts before an upload finishes. Background
+workers drain the outbox with exponential backoff on failure, tracked per
+target so a target that keeps failing doesn't hold back the others; a local
+file marked delete_after is only removed once every target acknowledged it.
+A target nothing is registered for any more (e.g. Drive, when its auth fails
+on the next start) is dropped from the jobs loaded from a previous run.
+
+Jobs are keyed: enqueuing a key that is already pending (e.g. the
+metadata.csv snapshot) updates the existing job instead of adding another.
+
+With shared=True several workers on one host can use one outbox directory:
+each worker periodically rescans it, and a job is only run by the worker
+holding its lock file, so jobs left by a stopped worker are picked up by the
+others and nothing is uploaded twice at the same time. Job paths point into
+the local clips directory, so the outbox must not be shared across hosts.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# How often shared outboxes look for jobs added by other workers
+RESCAN_INTERVAL = 10.0
+
+UPLOAD_SECONDS = REGISTRY.histogram(
+    "recorder_upload_seconds", "Time spent on one upload attempt per cloud target", ["target"]
+)
+UPLOAD_BYTES = REGISTRY.counter("recorder_upload_bytes_total", "Bytes uploaded per cloud target", ["target"])
+UPLOAD_RETRIES = REGISTRY.counter("recorder_upload_retries_total", "Failed upload attempts scheduled for retry", ["target"])
+
+
+class UploadOutbox:
+    def __init__(self, outbox_dir, handlers, workers=2, base_delay=2.0, max_delay=300.0, shared=False):
+        """handlers maps a target name ("dropbox", "drive") to a function(path) -> bool"""
+        self.outbox_dir = outbox_dir
+        self.handlers = handlers
+        self.workers = workers
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.shared = shared and fcntl is not None
+        self._jobs = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._loop = None
+        self._tasks = []
+        os.makedirs(outbox_dir, exist_ok=True)
+
+    def _job_path(self, key):
+        return os.path.join(self.outbox_dir, f"{key}.json")
+
+    def _persist(self, job):
+        path = self._job_path(job["key"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key):
+        self._jobs.pop(key, None)
+        try:
+            os.remove(self._job_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _read_job(self, key):
+        try:
+            with open(self._job_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _scan(self, retry_now=False):
+        """Sync the in-memory jobs with the job files on disk; retry_now makes loaded jobs due
+        immediately (on startup) instead of keeping the backoff another worker persisted"""
+        keys = set()
+        with self._lock:
+            for name in os.listdir(self.outbox_dir):
+                if not name.endswith(".json"):
+                    continue
+                key = name[:-len(".json")]
+                keys.add(key)
+                if key in self._jobs:
+                    continue
+                try:
+                    job = self._read_job(key)
+                    if job:
+                        if retry_now:
+                            job["next_attempt_at"] = 0
+                            job.pop("target_next_at", None)
+                        self._jobs[job["key"]] = job
+                except Exception as e:
+                    print(f"⚠️ Skipping unreadable outbox job {name}: {e}")
+            # Jobs finished by another worker
+            for key in [key for key in self._jobs if key not in keys and key not in self._in_flight]:
+                del self._jobs[key]
+
+    def _current(self, key):
+        """The job as it stands now; in a shared outbox another worker may have updated its file"""
+        if not self.shared:
+            return self._jobs.get(key)
+        latest = self._read_job(key)
+        if latest is None:
+            self._jobs.pop(key, None)
+            return None
+        existing = self._jobs.get(key)
+        if existing is None or existing["version"] != latest["version"]:
+            self._jobs[key] = latest
+        return self._jobs[key]
+
+    def load(self):
+        """Load pending jobs left over from a previous run"""
+        self._scan(retry_now=True)
+        if self._jobs:
+            print(f"📤 Outbox: {len(self._jobs)} pending uploads from previous run")
+
+    def enqueue(self, key, path, targets, delete_after=False):
+        """Add (or refresh) an upload job; returns once it is persisted to disk"""
+        targets = [target for target in targets if target in self.handlers]
+        if not targets:
+            return
+        with self._lock:
+            existing = self._current(key)
+            job = {
+                "key": key,
+                "path": path,
+                "targets": sorted(set(targets) | set(existing["targets"] if existing else [])),
+                "delete_after": delete_after,
+                "created_at": existing["created_at"] if existing else time.time(),
+                "attempts": 0,
+                "next_attempt_at": 0,
+                "version": uuid.uuid4().hex,
+            }
+            self._persist(job)
+            self._jobs[key] = job
+        self._notify()
+
+    def _notify(self):
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending_paths(self):
+        """Local paths that still have uploads pending"""
+        with self._lock:
+            return {job["path"] for job in self._jobs.values()}
+
+    def status(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        now = time.time()
+        return {
+            "pending": len(jobs),
+            "in_flight": len(self._in_flight),
+            "retrying": sum(1 for job in jobs if job["attempts"] > 0),
+            "oldest_age_seconds": round(now - min(job["created_at"] for job in jobs), 1) if jobs else 0,
+        }
+
+    def _claim(self):
+        """Pick the oldest due job; returns (job, seconds until the next one is due)"""
+        now = time.time()
+        with self._lock:
+            candidates = [job for key, job in self._jobs.items() if key not in self._in_flight]
+            due = [job for job in candidates if job["next_attempt_at"] <= now]
+            if due:
+                job = min(due, key=lambda j: j["created_at"])
+                self._in_flight.add(job["key"])
+                return dict(job, targets=list(job["targets"])), 0
+            if candidates:
+                return None, min(job["next_attempt_at"] for job in candidates) - now
+            return None, None
+
+    def _run_handler(self, target, path):
+        try:
+            with UPLOAD_SECONDS.time(target=target):
+                ok = bool(self.handlers[target](path))
+            if ok:
+                UPLOAD_BYTES.inc(os.path.getsize(path), target=target)
+            return ok
+        except Exception as e:
+            print(f"⚠️ {target} upload raised for {path}: {e}")
+            return False
+
+    def _lock_job(self, key):
+        """Take the job's cross-process lock; returns the lock fd or None if another worker has it"""
+        fd = os.open(os.path.join(self.outbox_dir, f"{key}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    def _unlock_job(self, key, fd):
+        with self._lock:
+            if key not in self._jobs:
+                try:
+                    os.remove(os.path.join(self.outbox_dir, f"{key}.lock"))
+                except FileNotFoundError:
+                    pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    async def _process_shared(self, job):
+        key = job["key"]
+        fd = self._lock_job(key)
+        if fd is None:
+            # Another worker is uploading it - look again later
+            with self._lock:
+                current = self._jobs.get(key)
+                if current:
+                    current["next_attempt_at"] = time.time() + self.base_delay
+                self._in_flight.discard(key)
+            return
+        try:
+            # The job file is the source of truth: another worker may have finished or updated it
+            with self._lock:
+                latest = self._current(key)
+                if latest is None:
+                    self._in_flight.discard(key)
+                    return
+                if latest["version"] != job["version"]:
+                    job = dict(latest, targets=list(latest["targets"]))
+            await self._process(job)
+        finally:
+            self._unlock_job(key, fd)
+
+    async def _process(self, job):
+        key = job["key"]
+        try:
+            if not os.path.exists(job["path"]):
+                print(f"⚠️ Dropping upload of missing file: {job['path']}")
+                with self._lock:
+                    if (self._current(key) or {}).get("version") == job["version"]:
+                        self._remove(key)
+                return
+
+            for target in list(job["targets"]):
+                if target not in self.handlers:
+                    # Loaded from a previous run that had this target (e.g. Drive auth failed this time):
+                    # nothing can upload it, and waiting for it would keep the clip forever
+                    print(f"⚠️ No {target} uploader configured - skipping it for {os.path.basename(job['path'])}")
+                    with self._lock:
+                        current = self._current(key)
+                        if current is None:
+                            return
+                        if target in current["targets"]:
+                            current["targets"].remove(target)
+                            self._persist(current)
+                    continue
+                if job.get("target_next_at", {}).get(target, 0) > time.time():
+                    # Still backing off from this target's last failure
+                    continue
+                ok = await asyncio.to_thread(self._run_handler, target, job["path"])
+                with self._lock:
+                    current = self._current(key)
+                    if current is None:
+                        return
+                    if not ok:
+                        UPLOAD_RETRIES.inc(target=target)
+                        attempts = current.setdefault("target_attempts", {})
+                        attempts[target] = attempts.get(target, 0) + 1
+                        current["attempts"] = sum(attempts.values())
+                        delay = min(self.max_delay, self.base_delay * 2 ** (attempts[target] - 1))
+                        current.setdefault("target_next_at", {})[target] = time.time() + delay * random.uniform(0.8, 1.2)
+                        self._persist(current)
+                        print(f"⚠️ Upload of {os.path.basename(job['path'])} to {target} failed "
+                              f"(attempt {attempts[target]}), retrying in {delay:.0f}s")
+                    elif current["version"] == job["version"]:
+                        current["targets"].remove(target)
+                        self._persist(current)
+
+            with self._lock:
+                current = self._current(key)
+                if current is None or current["version"] != job["version"]:
+                    # Re-enqueued while uploading - the newer job will run again
+                    return
+                if current["targets"]:
+                    # Due again when the first remaining target's backoff ends
+                    retry_at = current.get("target_next_at", {})
+                    current["next_attempt_at"] = min(retry_at.get(target, 0) for target in current["targets"])
+                    self._persist(current)
+                    return
+                self._remove(key)
+
+            if job["delete_after"] and os.path.exists(job["path"]):
+                os.remove(job["path"])
+                print(f"🗑️ Cleaned up local file: {os.path.basename(job['path'])}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job, wait = self._claim()
+            if job is None:
+                idle = RESCAN_INTERVAL if self.shared else 60
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(wait, idle) if wait is not None else idle)
+                except asyncio.TimeoutError:
+                    if self.shared:
+                        await asyncio.to_thread(self._scan)
+                continue
+            try:
+                await (self._process_shared(job) if self.shared else self._process(job))
+            except Exception as e:
+                print(f"⚠️ Outbox worker error for {job['key']}: {e}")
+            self._wakeup.set()
+
+    async def start(self):
+        """Start the background workers on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"📤 Upload outbox started with {self.workers} workers")
+
+    async def drain(self, timeout):
+        """Wait up to timeout seconds for the outbox to empty; returns True if it did"""
+        deadline = time.monotonic() + timeout
+        while self._jobs and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        return not self._jobs
+
+    async def stop(self):
+        """Stop the workers; unfinished jobs stay on disk for the next run"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
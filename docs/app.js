@@ -14,7 +14,10 @@ console.log(`API endpoint: ${API_BASE_URL}`);
 let mediaRecorder;
 let audioChunks = [];
 let currentSentence = null;
+let currentSentenceId = null; // Server-side ID of the current sentence
 let recordedBlob = null;
+let recordingKey = null; // Idempotency-Key of the current recording, reused when its submit is retried
+let clientToken = null; // Identifies this tab to /next_sentence, so a reload releases the previous reservation
 let recordingMimeType = 'audio/webm'; // Store the actual mime type used
 let speakerName = null; // Store speaker name
 let recordingTimer = null; // Timer for max recording duration
@@ -66,8 +69,17 @@ async function init() {
 // Check system health (Dropbox connection)
 async function checkSystemHealth() {
     try {
-        const response = await fetch(`${API_BASE_URL}/health`);
-        const health = await response.json();
+        let response = await fetch(`${API_BASE_URL}/health`);
+        let health = await response.json();
+        
+        // Server just started and is still restoring its state - wait for it
+        while (health.status === 'warming') {
+            showStatus('⏳ Server is starting up, one moment...', 'recording');
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            response = await fetch(`${API_BASE_URL}/health`);
+            health = await response.json();
+        }
+        hideStatus();
         
         if (health.status === 'unavailable' || !health.dropbox_connected) {
             showStatus('⚠️ System unavailable: Dropbox connection failed. Recording is disabled. Please try again later.', 'error');
@@ -186,7 +198,12 @@ async function loadNextSentence() {
     try {
         showStatus('Loading next sentence...', 'recording');
         
-        const response = await fetch(`${API_BASE_URL}/next_sentence`);
+        // Pass the tab's token so the server reserves this sentence for it (and frees the previous one)
+        const params = new URLSearchParams({ client: getClientToken() });
+        if (speakerName) {
+            params.set('speaker', speakerName);
+        }
+        const response = await fetch(`${API_BASE_URL}/next_sentence?${params}`);
         const data = await response.json();
         
         if (data.completed) {
@@ -194,7 +211,15 @@ async function loadNextSentence() {
             return;
         }
         
+        if (!data.sentence) {
+            // Every remaining sentence is reserved by another speaker right now
+            showStatus(data.message || 'Waiting for a free sentence...', 'recording');
+            setTimeout(loadNextSentence, 5000);
+            return;
+        }
+        
         currentSentence = data.sentence;
+        currentSentenceId = data.sentence_id;
         sentenceText.textContent = currentSentence;
         
         // Reset UI
@@ -255,6 +280,7 @@ async function startRecording() {
             // Create blob from chunks with the correct MIME type
             recordedBlob = new Blob(audioChunks, { type: recordingMimeType });
             console.log('Blob created:', recordedBlob.size, 'bytes');
+            recordingKey = newIdempotencyKey();
             
             if (recordedBlob.size === 0) {
                 console.error('❌ Recording is empty!');
@@ -399,13 +425,18 @@ async function submitRecording() {
         const formData = new FormData();
         formData.append('audio', recordedBlob, 'recording.wav');
         formData.append('sentence', currentSentence);
+        if (currentSentenceId !== null && currentSentenceId !== undefined) {
+            formData.append('sentence_id', currentSentenceId);
+        }
         formData.append('speaker', speakerName);
         
         console.log('Uploading to:', `${API_BASE_URL}/submit_recording`);
         
         // Submit to backend
-        const response = await fetch(`${API_BASE_URL}/submit_recording`, {
+        // Same key on every retry, so a submit that timed out but was saved isn't stored twice
+        const response = await fetchWithRetry(`${API_BASE_URL}/submit_recording`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': recordingKey },
             body: formData
         });
         
@@ -414,7 +445,7 @@ async function submitRecording() {
         console.log('Response data:', result);
         
         if (result.success) {
-            console.log('✅ Recording saved successfully!');
+            console.log(result.duplicate ? '✅ Recording was already saved:' : '✅ Recording saved successfully!', result.filename);
             showStatus('✅ Recording saved successfully!', 'success');
             
             // Wait a moment, then load next sentence
@@ -423,7 +454,10 @@ async function submitRecording() {
             }, 1500);
         } else {
             console.error('❌ Server returned error:', result);
-            showStatus('Error saving recording. Please try again.', 'error');
+            // Quality rejections (422) explain what to fix, e.g. "too quiet"; 413 gives the size limit;
+            // 503 says the server is still busy
+            const explained = [413, 422, 503].includes(response.status) && result.detail;
+            showStatus(explained ? result.detail : 'Error saving recording. Please try again.', 'error');
             
             // Re-enable buttons on error so user can try again
             submitBtn.disabled = false;
@@ -442,6 +476,54 @@ async function submitRecording() {
     }
 }
 
+// Retry 503s (server busy or starting up) and network errors with exponential backoff;
+// any other response (e.g. 413 recording too large) is returned right away
+async function fetchWithRetry(url, options, attempts = 4) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch(url, options);
+            if (response.status !== 503 || attempt === attempts) {
+                return response;
+            }
+        } catch (error) {
+            if (attempt === attempts) {
+                throw error;
+            }
+        }
+        const delay = 1000 * 2 ** (attempt - 1) * (0.8 + Math.random() * 0.4);
+        console.log(`Server busy, retrying in ${Math.round(delay)} ms (attempt ${attempt + 1}/${attempts})`);
+        showStatus('Server is busy, retrying upload...', 'recording');
+        await new Promise(resolve => setTimeout(resolve, delay));
+    }
+}
+
+// Per-tab token, kept in sessionStorage so it survives page reloads
+function getClientToken() {
+    if (!clientToken) {
+        try {
+            clientToken = sessionStorage.getItem('clientToken');
+        } catch (error) {
+            // Storage disabled - the token then lasts until the page is reloaded
+        }
+        if (!clientToken) {
+            clientToken = newIdempotencyKey();
+            try {
+                sessionStorage.setItem('clientToken', clientToken);
+            } catch (error) {}
+        }
+    }
+    return clientToken;
+}
+
+// Random key identifying one recording across submit retries
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    // randomUUID needs a secure context (HTTPS/localhost)
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+}
+
 // Reset recording UI
 function resetRecordingUI() {
     recordBtn.disabled = false;
@@ -451,6 +533,7 @@ function resetRecordingUI() {
     audioPlaybackSection.style.display = 'none';
     audioPlayer.src = '';
     recordedBlob = null;
+    recordingKey = null;
     document.querySelector('.sentence-display').classList.remove('recording');
 }
 
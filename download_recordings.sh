@@ -2,9 +2,17 @@
 
 # Script to download recordings from Render backend
 # Run this regularly to backup recordings before Render restarts
+#
+# Uses the /export endpoint (set EXPORT_TOKEN on the server and here).
+# The dataset is fetched as tar shards, cut by clip number. A shard that is
+# already downloaded is skipped when the server's shard list still reports
+# the same clips for it (first, last and count, saved next to the shard), so
+# an interrupted run resumes where it stopped and shards that gained or lost
+# clips since are fetched again.
 
-BACKEND_URL="https://eri-tig-recorder.onrender.com"
-OUTPUT_DIR="./downloaded_recordings"
+BACKEND_URL="${BACKEND_URL:-https://eri-tig-recorder.onrender.com}"
+OUTPUT_DIR="${OUTPUT_DIR:-./downloaded_recordings}"
+SHARD_SIZE="${SHARD_SIZE:-1000}"
 
 echo "📥 Downloading recordings from Render backend..."
 echo "Backend: $BACKEND_URL"
@@ -17,13 +25,44 @@ mkdir -p "$OUTPUT_DIR"
 echo "📊 Getting stats..."
 curl -s "$BACKEND_URL/stats" | python3 -m json.tool
 
+if [ -z "$EXPORT_TOKEN" ]; then
+    echo ""
+    echo "⚠️ EXPORT_TOKEN is not set - cannot download the dataset."
+    echo "   Set EXPORT_TOKEN on the server (Render Environment Variables) and run:"
+    echo "   EXPORT_TOKEN=... ./download_recordings.sh"
+    exit 1
+fi
+
 echo ""
-echo "⚠️ Note: Render's free tier has ephemeral storage."
-echo "⚠️ Recordings are only available if Dropbox backup is configured."
-echo ""
-echo "To view recordings, check your Dropbox at:"
-echo "https://www.dropbox.com/home/tigrigna_training_dataset"
+echo "📋 Fetching shard list (shard size $SHARD_SIZE)..."
+# One line per shard: index, then "first last clips" as it describes the shard's contents
+MANIFEST=$(curl -sf -H "Authorization: Bearer $EXPORT_TOKEN" "$BACKEND_URL/export/manifest?shard_size=$SHARD_SIZE" \
+    | python3 -c "import json, sys; [print(s['shard'], s['first'], s['last'], s['clips']) for s in json.load(sys.stdin)['shards']]") || {
+    echo "❌ Could not fetch the shard list (check EXPORT_TOKEN and BACKEND_URL)"
+    exit 1
+}
+SHARDS=$(printf "%s" "$MANIFEST" | grep -c .)
+echo "Found $SHARDS shards"
+
+while read -r i FIRST LAST CLIPS; do
+    [ -n "$i" ] || continue
+    SHARD_FILE=$(printf "%s/dataset-%06d.tar" "$OUTPUT_DIR" "$i")
+    SHARD_INFO="$FIRST $LAST $CLIPS"
+    if [ -f "$SHARD_FILE" ] && [ "$(cat "$SHARD_FILE.info" 2>/dev/null)" = "$SHARD_INFO" ]; then
+        echo "⏭️  $SHARD_FILE already downloaded"
+        continue
+    fi
+    echo "⬇️  Downloading shard $i ($CLIPS clips)..."
+    if curl -sf -H "Authorization: Bearer $EXPORT_TOKEN" -o "$SHARD_FILE.part" \
+        "$BACKEND_URL/export?shard_size=$SHARD_SIZE&shard=$i"; then
+        mv "$SHARD_FILE.part" "$SHARD_FILE"
+        echo "$SHARD_INFO" > "$SHARD_FILE.info"
+    else
+        echo "❌ Shard $i failed - run the script again to resume"
+        rm -f "$SHARD_FILE.part"
+        exit 1
+    fi
+done <<< "$MANIFEST"
+
 echo ""
-echo "✅ Make sure you added these to Render Environment Variables:"
-echo "   - DROPBOX_ACCESS_TOKEN"
-echo "   - DROPBOX_FOLDER_PATH=/tigrigna_training_dataset"
+echo "✅ Dataset saved to $OUTPUT_DIR (extract with: tar -xf <shard>.tar)"